@@ -1,13 +1,26 @@
-from flask import Flask, render_template, request, jsonify, send_from_directory, redirect, url_for
+from flask import Flask, render_template, request, jsonify, send_from_directory, redirect, url_for, Response, stream_with_context, make_response
 import razorpay
 import csv
 import os
+import posixpath
 import datetime
 import json
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 import uuid
+from db_routing import RoutingSession, replica_router, replica_reads
+from uploads import ImagePipeline, make_storage
+from idempotency import RecentResults, KeyedLocks
+from jobs import JobQueue
+import db_pool
+from cache import make_cache
+from critical_css import CriticalCSS
+import onboarding
+from profiling import profiler
+from sqlalchemy import event, func, inspect as sa_inspect, or_
+from sqlalchemy.exc import IntegrityError
+import time
 
 # Try to load environment variables
 try:
@@ -18,7 +31,8 @@ try:
 except ImportError:
     print("Warning: python-dotenv not installed. Skipping .env loading.")
 
-app = Flask(__name__, static_url_path='', static_folder='.', template_folder='.')
+# No built-in static route: serve_static below is the only file handler, so its guard always applies
+app = Flask(__name__, static_folder=None, template_folder='.')
 
 # ------------------------------------------------------------------------------
 # Configuration
@@ -32,16 +46,69 @@ app.config['SQLALCHEMY_DATABASE_URI'] = database_url
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 # Optimized DB Connection for Render/Cloud
-app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
-    "pool_pre_ping": True,  # Checks connection liveness before query (fixes disconnects)
+# Liveness: pre_ping (ping every checkout) / idle (ping only long-idle connections) / optimistic (recover on disconnect)
+DB_LIVENESS = os.getenv('DB_LIVENESS', 'pre_ping')
+DB_IDLE_PING_SECONDS = float(os.getenv('DB_IDLE_PING_SECONDS', '30'))
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = db_pool.engine_options(DB_LIVENESS, {
     "pool_recycle": 300,    # Recycle connections every 5 minutes
-    "pool_timeout": 30      # Wait max 30s for a connection
-}
+    "pool_timeout": float(os.getenv('DB_POOL_TIMEOUT', '30')),  # Wait max 30s for a connection
+    "pool_size": int(os.getenv('DB_POOL_SIZE', '5')),
+    "max_overflow": int(os.getenv('DB_MAX_OVERFLOW', '10')),
+})
+if ':memory:' not in database_url and database_url != 'sqlite://':
+    # Times checkouts and counts timeouts; exported at /admin/metrics/db-pool
+    app.config['SQLALCHEMY_ENGINE_OPTIONS']['poolclass'] = db_pool.InstrumentedQueuePool
+
+# Optional read replicas (comma-separated URLs) for admin / reporting reads.
+# Writes and read-after-write lookups always stay on the primary.
+app.config['SQLALCHEMY_REPLICA_URIS'] = [u.strip() for u in os.getenv('DATABASE_REPLICA_URLS', '').split(',') if u.strip()]
+app.config['REPLICA_MAX_LAG'] = float(os.getenv('REPLICA_MAX_LAG', '10'))          # Seconds behind before a replica is skipped
+app.config['REPLICA_CHECK_INTERVAL'] = float(os.getenv('REPLICA_CHECK_INTERVAL', '2'))
+app.config['REPLICA_HEARTBEAT_INTERVAL'] = float(os.getenv('REPLICA_HEARTBEAT_INTERVAL', '1'))  # Heartbeat stamp period (written by worker.py)
 
 RAZORPAY_KEY_ID = os.getenv('RAZORPAY_KEY_ID')
 RAZORPAY_KEY_SECRET = os.getenv('RAZORPAY_KEY_SECRET')
 ADMIN_PASSWORD = os.getenv('ADMIN_PASSWORD')
 
+# Two-tier cache (per-process LRU in front of Redis) when CACHE_URL is set; otherwise off.
+# CACHE_LOCAL_ONLY=1 caches in-process without Redis: only safe with a single worker process.
+cache = make_cache(os.getenv('CACHE_URL'), local_only=os.getenv('CACHE_LOCAL_ONLY') == '1',
+                   local_ttl=float(os.getenv('CACHE_LOCAL_TTL', '30')))
+USER_CACHE_TTL = 300
+ENTITLEMENT_CACHE_TTL = 60
+
+# Sampled request profiling (admin-only reports under /admin/profiling); 0 = off
+app.config['PROFILE_SAMPLE_RATE'] = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))         # e.g. 0.01 = 1% of requests
+app.config['PROFILE_INTERVAL_MS'] = float(os.getenv('PROFILE_INTERVAL_MS', '5'))         # Stack sampling period
+app.config['PROFILE_ALLOC_ROUTES'] = [r for r in os.getenv('PROFILE_ALLOC_ROUTES', '').split(',') if r]  # Endpoint names
+
+# Bulk onboarding may hash with a cheaper KDF (e.g. scrypt:8192:8:1); upgraded on first login
+ONBOARDING_HASH_METHOD = os.getenv('ONBOARDING_HASH_METHOD') or None
+
+# Profile image uploads: stored outside the served tree, resized in the background
+app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_UPLOAD_MB', '8')) * 1024 * 1024
+MEDIA_STORAGE = os.getenv('MEDIA_STORAGE', 'local')  # local / cloudinary / cloudinary-fake
+MEDIA_ROOT = os.getenv('MEDIA_ROOT', os.path.join(app.instance_path, 'media'))
+MEDIA_CACHE_SECONDS = 60 * 60 * 24 * 365  # Keys are versioned, so cache for a year
+
+# CSV ledger of paid orders (student PII) appended by the worker; kept outside the served tree
+ORDERS_LEDGER_PATH = os.getenv('ORDERS_LEDGER_PATH', os.path.join(app.instance_path, 'orders.csv'))
+
+# Landing page: inline above-the-fold CSS, hint critical assets before the HTML arrives
+app.config['CRITICAL_CSS'] = os.getenv('CRITICAL_CSS', '1') == '1'
+critical_css = CriticalCSS(os.path.join(app.root_path, 'styles.css'), os.path.join(app.root_path, 'index.html'))
+FONTS_CSS_URL = 'https://fonts.googleapis.com/css2?family=Plus+Jakarta+Sans:wght@400;500;600;700;800&display=swap'
+# Sent as Link headers on "/"; a CDN/proxy with Early Hints enabled (Cloudflare,
+# Fastly, nginx early_hints) replays them as a 103 while the page is rendered.
+EARLY_HINT_LINKS = ', '.join([
+    '</styles.css>; rel=preload; as=style',
+    '</script.js>; rel=preload; as=script',
+    f'<{FONTS_CSS_URL}>; rel=preload; as=style',
+    '<https://fonts.gstatic.com>; rel=preconnect; crossorigin',
+    '<https://cdnjs.cloudflare.com>; rel=preconnect',
+    '<https://unpkg.com>; rel=preconnect',
+])
+
 client = None
 if RAZORPAY_KEY_ID and RAZORPAY_KEY_SECRET:
     client = razorpay.Client(auth=(RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET))
@@ -51,7 +118,7 @@ else:
 # ------------------------------------------------------------------------------
 # Database Setup
 # ------------------------------------------------------------------------------
-db = SQLAlchemy(app)
+db = SQLAlchemy(app, session_options={'class_': RoutingSession})
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'index' # Redirect here if not logged in
@@ -63,12 +130,17 @@ class User(UserMixin, db.Model):
     phone = db.Column(db.String(20), unique=True, nullable=False)
     password_hash = db.Column(db.String(200), nullable=False)
 
+    profile_image = db.relationship('ProfileImage', uselist=False, cascade='all, delete-orphan')
+
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
 
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
 
+    def needs_rehash(self):
+        return bool(ONBOARDING_HASH_METHOD) and self.password_hash.startswith(ONBOARDING_HASH_METHOD + '$')
+
     def as_dict(self):
         return {
             'id': self.id,
@@ -113,13 +185,197 @@ class Payment(db.Model):
             'timestamp': self.timestamp.strftime("%Y-%m-%d %H:%M:%S")
         }
 
+class Lead(db.Model):
+    # Enquiry form submissions (previously only appended to leads.csv by server.py)
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100))
+    phone = db.Column(db.String(20), unique=True, nullable=False)
+    class_grade = db.Column(db.String(50))
+    message = db.Column(db.Text)
+    timestamp = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+
+class ProfileImage(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), unique=True, nullable=False)
+    # Bumped on every upload so URLs change and old variants can be cached forever
+    version = db.Column(db.String(32), nullable=False)
+    # Status: PENDING, READY, FAILED
+    status = db.Column(db.String(20), default='PENDING')
+    thumb_url = db.Column(db.String(300))
+    medium_url = db.Column(db.String(300))
+    updated_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
+    def as_dict(self):
+        return {
+            'status': self.status,
+            'thumb_url': self.thumb_url,
+            'medium_url': self.medium_url
+        }
+
+class PaymentVerification(db.Model):
+    # One row per verify-payment submission; the unique key makes retries/double clicks idempotent
+    id = db.Column(db.Integer, primary_key=True)
+    idempotency_key = db.Column(db.String(210), unique=True, nullable=False)
+    # State: PROCESSING, DONE
+    state = db.Column(db.String(20), default='PROCESSING')
+    response_status = db.Column(db.Integer)
+    response_body = db.Column(db.Text)
+    claimed_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+
+class Job(db.Model):
+    # Background work queued by the web app and run by worker.py
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    # State: QUEUED, RUNNING, DONE, DEAD
+    state = db.Column(db.String(20), default='QUEUED', index=True)
+    attempts = db.Column(db.Integer, default=0)
+    max_attempts = db.Column(db.Integer, default=5)
+    run_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, index=True)
+    locked_by = db.Column(db.String(100))
+    locked_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    dedupe_key = db.Column(db.String(150), index=True)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+
+class PurchaseRollup(db.Model):
+    # Per-student purchase summary, refreshed by verify-payment and the update_rollup job
+    id = db.Column(db.Integer, primary_key=True)
+    student_email = db.Column(db.String(100), unique=True, nullable=False)
+    paid_count = db.Column(db.Integer, default=0)
+    last_plan_name = db.Column(db.String(100))
+    last_payment_id = db.Column(db.Integer)  # Highest paid Payment.id included in paid_count
+    updated_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
+class LedgerEntry(db.Model):
+    # Transaction ids already appended to the orders ledger CSV, so a retried job never appends twice
+    id = db.Column(db.Integer, primary_key=True)
+    transaction_id = db.Column(db.String(100), unique=True, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+
+class ChangeEvent(db.Model):
+    # Append-only feed of User/Payment changes; the id is the cursor for the /admin/stream SSE endpoint
+    id = db.Column(db.Integer, primary_key=True)
+    entity = db.Column(db.String(20), nullable=False)  # user / payment
+    entity_id = db.Column(db.Integer)
+    # Op: upsert, delete, reset (table wiped by a bulk delete)
+    op = db.Column(db.String(10), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, index=True)
+
+def _history_values(obj, attr):
+    # Every value the attribute had before or has after the pending change
+    history = sa_inspect(obj).attrs[attr].history
+    return {v for values in (history.added, history.unchanged, history.deleted) for v in (values or ()) if v}
+
+@event.listens_for(db.session, 'after_flush')
+def record_changes(session, flush_context):
+    # Runs inside the flushing transaction, so the feed commits (or rolls back) with the change itself
+    rows = []
+    for obj in session.new:
+        if isinstance(obj, Payment) and not obj.razorpay_payment_id:
+            continue  # Checkout placeholders never show on the dashboard
+        if isinstance(obj, (User, Payment)):
+            rows.append({'entity': obj.__tablename__, 'entity_id': obj.id, 'op': 'upsert'})
+    for obj in session.dirty:
+        if isinstance(obj, Payment) and not _history_values(obj, 'razorpay_payment_id'):
+            continue  # Hidden before and after this change
+        if isinstance(obj, (User, Payment)) and session.is_modified(obj, include_collections=False):
+            rows.append({'entity': obj.__tablename__, 'entity_id': obj.id, 'op': 'upsert'})
+    for obj in session.deleted:
+        if isinstance(obj, Payment) and not _history_values(obj, 'razorpay_payment_id'):
+            continue
+        if isinstance(obj, (User, Payment)):
+            rows.append({'entity': obj.__tablename__, 'entity_id': obj.id, 'op': 'delete'})
+    if rows:
+        session.connection().execute(ChangeEvent.__table__.insert(), rows)
+
+# Cache invalidation: collect keys touched by a flush, publish them once the transaction commits
+
+@event.listens_for(db.session, 'after_flush')
+def collect_cache_invalidations(session, flush_context):
+    keys = session.info.setdefault('cache_invalidations', set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, User):
+            keys.add(('user', obj.id))
+        elif isinstance(obj, Payment):
+            keys.update(('entitlement', f"email:{v}") for v in _history_values(obj, 'student_email'))
+            keys.update(('entitlement', f"phone:{v}") for v in _history_values(obj, 'student_phone'))
+
+@event.listens_for(db.session, 'after_commit')
+def publish_cache_invalidations(session):
+    for namespace, key in session.info.pop('cache_invalidations', ()):
+        cache.invalidate(namespace, key)
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def discard_cache_invalidations(session, previous_transaction):
+    session.info.pop('cache_invalidations', None)
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    # Runs on every authenticated request; served from cache as a detached User (no password hash)
+    data = cache.get_or_set('user', int(user_id), lambda: _user_cache_entry(int(user_id)), ttl=USER_CACHE_TTL)
+    return User(**data) if data else None
+
+def _user_cache_entry(user_id):
+    user = db.session.get(User, user_id)
+    return user.as_dict() if user else None
+
+def purchase_summary(email):
+    # Entitlement data used by checkout(): paid purchase count and the latest paid plan
+    def load():
+        paid = Payment.query.filter(
+            Payment.student_email == email,
+            Payment.status.in_(['PAID', 'MOCK_PAID'])
+        )
+        last_payment = paid.order_by(Payment.timestamp.desc()).first()
+        return {
+            'count': paid.count(),
+            'last_plan_name': last_payment.plan_name if last_payment else None,
+            'last_plan_category': last_payment.plan_category if last_payment else None
+        }
+    return cache.get_or_set('entitlement', f"email:{email}", load, ttl=ENTITLEMENT_CACHE_TTL)
+
+def active_plan_for_phone(phone):
+    # Entitlement data used by my_plan(): latest PAID plan, falling back to MOCK_PAID
+    def load():
+        latest_payment = Payment.query.filter_by(student_phone=phone, status='PAID')\
+            .order_by(Payment.id.desc()).first()
+        if not latest_payment:
+            latest_payment = Payment.query.filter_by(student_phone=phone, status='MOCK_PAID')\
+                .order_by(Payment.id.desc()).first()
+        if not latest_payment:
+            return None
+        return {
+            'name': latest_payment.plan_name,
+            'category': latest_payment.plan_category,
+            'custom_id': latest_payment.custom_id
+        }
+    return cache.get_or_set('entitlement', f"phone:{phone}", load, ttl=ENTITLEMENT_CACHE_TTL)
+
+def profile_image_for(user_id):
+    return ProfileImage.query.filter_by(user_id=user_id).first()
 
 # Create tables
 with app.app_context():
     db.create_all()
+    onboarding.create_lookup_indexes(db.engine, User)
+
+replica_router.init_app(app, db)
+profiler.init_app(app)
+
+with app.app_context():
+    db_pool.instrument_engine(db.engine, 'primary', DB_LIVENESS, DB_IDLE_PING_SECONDS)
+for i, replica in enumerate(replica_router.replicas):
+    db_pool.instrument_engine(replica, f'replica{i}', DB_LIVENESS, DB_IDLE_PING_SECONDS)
+
+job_queue = JobQueue(db, Job, max_attempts=int(os.getenv('JOB_MAX_ATTEMPTS', '5')))
+
+image_pipeline = ImagePipeline(
+    make_storage(MEDIA_STORAGE, MEDIA_ROOT),
+    workers=int(os.getenv('IMAGE_WORKERS', '2')),
+    tmp_dir=os.path.join(app.instance_path, 'upload_tmp')
+)
 
 # ------------------------------------------------------------------------------
 # Routes
@@ -127,7 +383,23 @@ with app.app_context():
 
 @app.route('/')
 def index():
-    return render_template('index.html')
+    # Auth state rides along with the page so script.js doesn't need a /api/user round trip
+    if current_user.is_authenticated:
+        auth_state = {'authenticated': True, 'user': current_user.as_dict()}
+    else:
+        auth_state = {'authenticated': False}
+    # ?critical=0 serves the old render-blocking stylesheet (for A/B benchmarking)
+    inline_css = None
+    if app.config['CRITICAL_CSS'] and request.args.get('critical') != '0':
+        inline_css = critical_css.get()
+
+    response = make_response(render_template('index.html', auth_state=auth_state,
+                                             critical_css=inline_css, fonts_css_url=FONTS_CSS_URL))
+    response.headers['Link'] = EARLY_HINT_LINKS
+    # The page now carries per-user data
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.headers['Vary'] = 'Cookie'
+    return response
 
 @app.route('/index.html')
 def index_redirect():
@@ -135,8 +407,20 @@ def index_redirect():
 
 @app.route('/<path:path>')
 def serve_static(path):
+    # Never serve the instance folder (SQLite DB, media originals, temp uploads) or the CSV exports (student PII)
+    path = posixpath.normpath(path)
+    if path.split('/', 1)[0] == 'instance' or path.lower().endswith('.csv'):
+        return 'Not Found', 404
     return send_from_directory('.', path)
 
+@app.route('/media/<path:key>')
+def serve_media(key):
+    if MEDIA_STORAGE != 'local':
+        return 'Not Found', 404
+    response = send_from_directory(image_pipeline.storage.root, key, max_age=MEDIA_CACHE_SECONDS)
+    response.headers['Cache-Control'] = f'public, max-age={MEDIA_CACHE_SECONDS}, immutable'
+    return response
+
 # Pricing Configuration (Must match frontend)
 PRICING_CONFIG = {
     'jan': {'standard': 699, 'elite': 999},
@@ -202,10 +486,8 @@ def checkout():
         
         if current_user.is_authenticated:
             # 1. Check Total Purchase Count
-            purchase_count = Payment.query.filter(
-                Payment.student_email == current_user.email,
-                Payment.status.in_(['PAID', 'MOCK_PAID'])
-            ).count()
+            summary = purchase_summary(current_user.email)
+            purchase_count = summary['count']
             
             if purchase_count >= 2:
                 limit_reached = True
@@ -214,17 +496,12 @@ def checkout():
             if not limit_reached:
                 # Find latest ACTIVE plan
                 # Note: We check for 'PAID' or 'MOCK_PAID' just to be safe if testing
-                last_payment = Payment.query.filter(
-                    Payment.student_email == current_user.email, 
-                    Payment.status.in_(['PAID', 'MOCK_PAID'])
-                ).order_by(Payment.timestamp.desc()).first()
-                
-                if last_payment:
+                if summary['count']:
                     # Determine current plan value
-                    old_category = last_payment.plan_category
+                    old_category = summary['last_plan_category']
                     if old_category:
                         old_category = old_category.lower()
-                    old_plan_name = last_payment.plan_name.lower() if last_payment.plan_name else ''
+                    old_plan_name = summary['last_plan_name'].lower() if summary['last_plan_name'] else ''
                     old_type = 'elite' if 'elite' in old_plan_name else 'standard'
                     
                     # Get prices
@@ -251,6 +528,61 @@ def checkout():
 def checkout_html():
     return redirect(url_for('checkout'))
 
+# WhatsApp Links Configuration
+WHATSAPP_LINKS = {
+    'april': {
+        'standard': 'https://chat.whatsapp.com/D5jRDS7Kqjb1LUF0O9VXY7',
+        'elite': 'https://chat.whatsapp.com/JRYpdmuAweo2VL6Zuud60N'
+    },
+    'april-boards': {
+        'standard': 'https://chat.whatsapp.com/KMgl7zS0d6v3Zuq06Cubzm',
+        'elite': 'https://chat.whatsapp.com/DobPEtJV5MSICtNiQRWCXD'
+    }
+}
+
+def whatsapp_link_for(payment):
+    try:
+        p_cat = payment.plan_category.lower() if payment.plan_category else 'april'
+        p_name = payment.plan_name.lower() if payment.plan_name else 'standard'
+        p_type = 'elite' if 'elite' in p_name else 'standard'
+        return WHATSAPP_LINKS.get(p_cat, {}).get(p_type)
+    except Exception:
+        return None
+
+def refresh_purchase_rollup(email):
+    """Recompute a student's rollup from scratch (added to the session, committed by the caller)."""
+    paid = Payment.query.filter(
+        Payment.student_email == email,
+        Payment.status.in_(['PAID', 'MOCK_PAID'])
+    )
+    count, last_id = paid.with_entities(func.count(Payment.id), func.max(Payment.id)).one()
+    rollup = PurchaseRollup.query.filter_by(student_email=email).first()
+    if not count:
+        if rollup:
+            db.session.delete(rollup)
+        return None
+    latest = db.session.get(Payment, last_id)
+    if not rollup:
+        rollup = PurchaseRollup(student_email=email)
+        db.session.add(rollup)
+    rollup.paid_count = count
+    rollup.last_payment_id = last_id
+    rollup.last_plan_name = latest.plan_name
+    return rollup
+
+def paid_purchase_count(payment):
+    # Prefer the rollup (refreshed by verify-payment and the job worker); count directly if it hasn't caught up
+    email = payment.student_email
+    if not email:
+        return 0
+    rollup = PurchaseRollup.query.filter_by(student_email=email).first()
+    if rollup and rollup.last_payment_id and rollup.last_payment_id >= payment.id:
+        return rollup.paid_count
+    return Payment.query.filter(
+        Payment.student_email == email,
+        Payment.status.in_(['PAID', 'MOCK_PAID'])
+    ).count()
+
 @app.route('/success')
 def success():
     # Get payment_id (DB ID) or custom_id from args
@@ -261,44 +593,18 @@ def success():
     title = "Enrollment Successful!"
     message = "Thank you for joining JEETO JEE. We have received your payment."
     
-# WhatsApp Links Configuration
-    WHATSAPP_LINKS = {
-        'april': {
-            'standard': 'https://chat.whatsapp.com/D5jRDS7Kqjb1LUF0O9VXY7',
-            'elite': 'https://chat.whatsapp.com/JRYpdmuAweo2VL6Zuud60N'
-        },
-        'april-boards': {
-            'standard': 'https://chat.whatsapp.com/KMgl7zS0d6v3Zuq06Cubzm',
-            'elite': 'https://chat.whatsapp.com/DobPEtJV5MSICtNiQRWCXD'
-        }
-    }
-
     whatsapp_link = None
     if cid:
         payment = Payment.query.filter_by(custom_id=cid).first()
         if payment:
              # 2. Determine Message Type
-             user_email = payment.student_email
-             
              # Count PAID/MOCK_PAID payments for this user, including this one
-             count = 0
-             if user_email:
-                 count = Payment.query.filter(
-                    Payment.student_email == user_email,
-                    Payment.status.in_(['PAID', 'MOCK_PAID'])
-                 ).count()
+             count = paid_purchase_count(payment)
              
              plan_name = payment.plan_name or "Premium Plan"
              
              # Determine Link
-             try:
-                 p_cat = payment.plan_category.lower() if payment.plan_category else 'april'
-                 p_name = payment.plan_name.lower() if payment.plan_name else 'standard'
-                 p_type = 'elite' if 'elite' in p_name else 'standard'
-                 
-                 whatsapp_link = WHATSAPP_LINKS.get(p_cat, {}).get(p_type)
-             except Exception:
-                 pass
+             whatsapp_link = whatsapp_link_for(payment)
 
              if count > 1:
                  # Upgrade
@@ -328,9 +634,15 @@ def register():
     # Basic Validation
     if not name or not email or not phone or not password:
         return jsonify({'error': 'All fields are required'}), 400
-    
-    # Check if user exists (Check email or phone individually)
-    if User.query.filter((User.email == email) | (User.phone == phone)).first():
+    try:
+        phone = onboarding.normalize_phone(phone)
+    except ValueError:
+        return jsonify({'error': 'Please enter a valid 10-digit phone number'}), 400
+    email = email.strip()
+
+    # Check if user exists (Check email or phone individually); same rules as bulk onboarding
+    taken_emails, taken_phones = onboarding.find_taken(db.session.connection(), User, {email}, {phone})
+    if taken_emails or taken_phones:
         return jsonify({'error': 'User with this email or phone already exists'}), 400
 
     new_user = User(name=name, email=email, phone=phone)
@@ -348,9 +660,19 @@ def login():
     identifier = data.get('identifier')
     password = data.get('password')
 
-    user = User.query.filter((User.email == identifier) | (User.phone == identifier)).first()
+    # Emails match case-insensitively, phones on their last 10 digits (both indexed expressions)
+    identifier = (identifier or '').strip()
+    matches = [func.lower(User.email) == identifier.lower()]
+    try:
+        matches.append(onboarding.phone_key(User.phone, db.engine.dialect.name) == onboarding.normalize_phone(identifier))
+    except ValueError:
+        pass
+    user = User.query.filter(or_(*matches)).first()
 
     if user and user.check_password(password):
+        if user.needs_rehash():
+            user.set_password(password)
+            db.session.commit()
         login_user(user, remember=True)
         return jsonify({'message': 'Login successful', 'user': user.as_dict()})
     
@@ -444,9 +766,44 @@ def verify_payment():
     if not client:
         return jsonify({'error': 'Razorpay not configured'}), 503
 
+    data = request.json or {}
+    key = verification_key(data)
+    if not key:
+        result, status = _verify_payment(data)
+        return jsonify(result), status
+
+    # Fast path: duplicate submission already answered by this worker
+    stored = recent_verifications.get(key)
+    if stored:
+        return jsonify(stored[0]), stored[1]
+
+    with verification_locks.hold(key):
+        stored = recent_verifications.get(key)
+        if not stored:
+            stored = _run_verification_once(key, data)
+    return jsonify(stored[0]), stored[1]
+
+# Fulfilment jobs run by worker.py (see tasks.py); committed together with the PAID status
+POST_PAYMENT_JOBS = ['send_receipt', 'send_community_invite', 'append_order_ledger', 'update_rollup']
+
+def enqueue_post_payment(payment):
+    if payment.id is None:
+        db.session.flush()
+    for kind in POST_PAYMENT_JOBS:
+        job_queue.enqueue(kind, {'payment_id': payment.id}, dedupe_key=f"{kind}:{payment.id}")
+    if payment.student_email:
+        # Also refreshed here, in the PAID transaction, because /success is the very next request
+        # and the worker won't have run yet. A savepoint so a concurrent purchase by the same
+        # student (both creating the rollup) never fails the verification; the job converges it.
+        try:
+            with db.session.begin_nested():
+                refresh_purchase_rollup(payment.student_email)
+        except IntegrityError:
+            pass
+
+def _verify_payment(data):
+    # The actual verification; only ever runs once per idempotency key
     try:
-        data = request.json
-        
         # MOCK BYPASS: Check if this is a simulation
         razorpay_payment_id = data.get('razorpay_payment_id', '')
         custom_id = data.get('custom_id') # We need to pass this from frontend or lookup by Order ID
@@ -489,15 +846,17 @@ def verify_payment():
                 payment.status = 'PAID' # Mark as truly PAID
                 # User requested NO transaction ID for zero-cost upgrades, so we allow empty string
                 payment.razorpay_payment_id = razorpay_payment_id 
+                enqueue_post_payment(payment)
                 db.session.commit()
-            return jsonify({'status': 'success', 'custom_id': payment.custom_id if payment else ''})
+            return {'status': 'success', 'custom_id': payment.custom_id if payment else ''}, 200
 
         if razorpay_payment_id.startswith('pay_mock_'):
             if payment:
                 payment.status = 'MOCK_PAID'
                 payment.razorpay_payment_id = razorpay_payment_id
+                enqueue_post_payment(payment)
                 db.session.commit()
-            return jsonify({'status': 'success', 'custom_id': payment.custom_id if payment else ''})
+            return {'status': 'success', 'custom_id': payment.custom_id if payment else ''}, 200
 
         params_dict = {
             'razorpay_order_id': data['razorpay_order_id'],
@@ -510,16 +869,99 @@ def verify_payment():
             payment.status = 'PAID'
             payment.razorpay_payment_id = data['razorpay_payment_id']
             payment.razorpay_signature = data['razorpay_signature']
+            enqueue_post_payment(payment)
             db.session.commit()
             
-        return jsonify({'status': 'success', 'custom_id': payment.custom_id if payment else ''})
+        return {'status': 'success', 'custom_id': payment.custom_id if payment else ''}, 200
     except razorpay.errors.SignatureVerificationError:
         db.session.rollback()
-        return jsonify({'error': 'Payment verification failed'}), 400
+        return {'error': 'Payment verification failed'}, 400
     except Exception as e:
         db.session.rollback()
         print(f"Error verifying payment: {e}")
-        return jsonify({'error': str(e)}), 500
+        return {'error': str(e)}, 500
+
+# Verification outcomes already stored, so duplicates skip the DB entirely
+recent_verifications = RecentResults(max_entries=10000, ttl=600)
+verification_locks = KeyedLocks()
+VERIFY_CLAIM_TIMEOUT = 30   # Seconds before an unfinished claim (crashed worker) can be taken over
+VERIFY_WAIT_SECONDS = 10    # How long a duplicate waits for the first submission to finish
+
+def verification_key(data):
+    order_id = data.get('razorpay_order_id') or ''
+    payment_id = data.get('razorpay_payment_id') or ''
+    if not order_id and not payment_id:
+        return None
+    return f"{order_id}|{payment_id}"
+
+def _stored_outcome(record):
+    return json.loads(record.response_body), record.response_status
+
+def _run_verification_once(key, data, attempts=3):
+    # Claim the key in the DB so only one worker ever verifies it.
+    # Only successful outcomes are stored and replayed: the key doesn't cover the
+    # signature, so a rejected (e.g. forged) submission must not lock out the real one.
+    record = PaymentVerification.query.filter_by(idempotency_key=key).first()
+    if record and record.state == 'DONE':
+        outcome = _stored_outcome(record)
+        recent_verifications.put(key, outcome)
+        return outcome
+
+    claimed = False
+    if not record:
+        try:
+            db.session.add(PaymentVerification(idempotency_key=key))
+            db.session.commit()
+            claimed = True
+        except IntegrityError:
+            db.session.rollback()
+    elif record.state != 'DONE':
+        # Take over claims left behind by a crashed worker
+        stale_before = datetime.datetime.utcnow() - datetime.timedelta(seconds=VERIFY_CLAIM_TIMEOUT)
+        claimed = PaymentVerification.query.filter(
+            PaymentVerification.idempotency_key == key,
+            PaymentVerification.state == 'PROCESSING',
+            PaymentVerification.claimed_at < stale_before
+        ).update({'claimed_at': datetime.datetime.utcnow()}) == 1
+        db.session.commit()
+
+    if not claimed:
+        outcome = _wait_for_verification(key)
+        if outcome is None:
+            # The other submission failed and released the claim; verify this one ourselves
+            if attempts > 1:
+                return _run_verification_once(key, data, attempts - 1)
+            return {'error': 'Payment verification in progress, please retry'}, 503
+        recent_verifications.put(key, outcome)
+        return outcome
+
+    result, status = _verify_payment(data)
+    record = PaymentVerification.query.filter_by(idempotency_key=key).first()
+    if status >= 300:
+        # Rejected or transient failure: release the claim so the next submission is verified afresh
+        db.session.delete(record)
+    else:
+        record.state = 'DONE'
+        record.response_status = status
+        record.response_body = json.dumps(result)
+    db.session.commit()
+
+    if status < 300:
+        recent_verifications.put(key, (result, status))
+    return result, status
+
+def _wait_for_verification(key):
+    """Stored outcome once the claimant finishes, None if it released the claim."""
+    deadline = time.time() + VERIFY_WAIT_SECONDS
+    while time.time() < deadline:
+        db.session.expire_all()
+        record = PaymentVerification.query.filter_by(idempotency_key=key).first()
+        if record and record.state == 'DONE':
+            return _stored_outcome(record)
+        if not record:
+            return None
+        time.sleep(0.05)
+    return {'error': 'Payment verification in progress, please retry'}, 503
 
 # ------------------------------------------------------------------------------
 # Admin Routes
@@ -547,10 +989,14 @@ def admin_logout():
     return redirect(url_for('admin_login'))
 
 @app.route('/admin/dashboard')
+@replica_reads
 def admin_dashboard():
     if not session.get('admin_logged_in'):
         return redirect(url_for('admin_login'))
     
+    # Read the cursor first: anything that changes while we render arrives over /admin/stream
+    stream_cursor = db.session.query(func.max(ChangeEvent.id)).scalar() or 0
+
     users = User.query.all()
     # Loading orders from CSV for now, or we could add a DB model for Orders later if needed.
     # For now, let's just display users. If orders are in CSV, we can read them.
@@ -579,35 +1025,244 @@ def admin_dashboard():
         if norm_email and norm_email not in user_latest_order:
             user_latest_order[norm_email] = order.custom_id
             
-    return render_template('templates/admin_dashboard.html', users=users, orders=orders, user_orders=user_latest_order, normalize=normalize)
+    return render_template('templates/admin_dashboard.html', users=users, orders=orders, user_orders=user_latest_order, normalize=normalize, stream_cursor=stream_cursor)
+
+# Live dashboard: Server-Sent Events carrying User/Payment deltas from the change feed
+STREAM_POLL_SECONDS = 1
+STREAM_KEEPALIVE_SECONDS = 15
+app.config.setdefault('ADMIN_STREAM_MAX_SECONDS', 300)  # Browser reconnects with Last-Event-ID, so streams can be short-lived
+# Ids are assigned at insert, not commit: an event only streams once it is this old, so a slower
+# transaction holding a lower id commits before the cursor moves past it
+app.config.setdefault('ADMIN_STREAM_SETTLE_SECONDS', 2)
+
+def payment_delta(payment):
+    return {
+        'id': payment.id,
+        'custom_id': payment.custom_id,
+        'date': payment.timestamp.strftime('%Y-%m-%d %H:%M') if payment.timestamp else '',
+        'student_name': payment.student_name,
+        'student_email': payment.student_email,
+        'student_phone': payment.student_phone,
+        'plan_name': payment.plan_name,
+        'plan_category': payment.plan_category,
+        'amount': payment.amount,
+        'status': payment.status,
+        'razorpay_payment_id': payment.razorpay_payment_id,
+        # Same filter as admin_dashboard(): only payments with a Razorpay payment ID are listed
+        'visible': bool(payment.razorpay_payment_id)
+    }
+
+def collect_deltas(events):
+    # Collapse to the latest op per row, then load the surviving rows in one query per table
+    latest = {}
+    resets = []
+    for e in events:
+        if e.op == 'reset':
+            resets.append(e.entity)
+            latest = {key: op for key, op in latest.items() if key[0] != e.entity}
+        else:
+            latest[(e.entity, e.entity_id)] = e.op
+
+    deltas = {'reset': resets, 'users': [], 'payments': [], 'deleted': {'user': [], 'payment': []}}
+    for entity, model, key, serialize in (('user', User, 'users', User.as_dict), ('payment', Payment, 'payments', payment_delta)):
+        ids = [i for (ent, i), op in latest.items() if ent == entity and op == 'upsert']
+        found = {row.id: row for row in model.query.filter(model.id.in_(ids))} if ids else {}
+        deltas[key] = [serialize(found[i]) for i in ids if i in found]
+        deltas['deleted'][entity] = [i for (ent, i), op in latest.items()
+                                     if ent == entity and (op == 'delete' or (op == 'upsert' and i not in found))]
+    return deltas
+
+def sse(data, event_id=None, event_name=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event_name:
+        lines.append(f"event: {event_name}")
+    lines.append(f"data: {json.dumps(data)}")
+    return '\n'.join(lines) + '\n\n'
+
+@app.route('/admin/stream')
+def admin_stream():
+    if not session.get('admin_logged_in'):
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    try:
+        cursor = int(request.headers.get('Last-Event-ID') or request.args.get('cursor') or 0)
+    except ValueError:
+        cursor = 0
+    max_seconds = app.config['ADMIN_STREAM_MAX_SECONDS']
+    settle_seconds = app.config['ADMIN_STREAM_SETTLE_SECONDS']
+
+    def generate(cursor):
+        deadline = time.time() + max_seconds
+        last_sent = time.time()
+        yield 'retry: 2000\n\n'
+
+        # Cursor older than the retained feed (pruned by the worker): the client reloads the page
+        oldest = db.session.query(func.min(ChangeEvent.id)).scalar()
+        if cursor and oldest and oldest > cursor + 1:
+            yield sse({'cursor': cursor}, None, 'resync')
+            return
+
+        while time.time() < deadline:
+            settled = datetime.datetime.utcnow() - datetime.timedelta(seconds=settle_seconds)
+            events = ChangeEvent.query.filter(
+                ChangeEvent.id > cursor, ChangeEvent.created_at <= settled
+            ).order_by(ChangeEvent.id).limit(500).all()
+            if events:
+                cursor = events[-1].id
+                yield sse(collect_deltas(events), cursor, 'changes')
+                last_sent = time.time()
+            elif time.time() - last_sent >= STREAM_KEEPALIVE_SECONDS:
+                yield ': keep-alive\n\n'
+                last_sent = time.time()
+            # Don't hold a pooled connection while idle
+            db.session.close()
+            if not events:
+                time.sleep(STREAM_POLL_SECONDS)
+
+    response = Response(stream_with_context(generate(cursor)), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/admin/metrics/db-pool')
+def db_pool_metrics():
+    if not session.get('admin_logged_in'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    # Numbers are per worker process (pid included); scrape each worker or aggregate downstream
+    if request.args.get('format') == 'prometheus':
+        return db_pool.prometheus_text(), 200, {'Content-Type': 'text/plain; version=0.0.4'}
+    return jsonify(db_pool.snapshot())
+
+@app.route('/admin/metrics/cache')
+def cache_metrics():
+    if not session.get('admin_logged_in'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    return jsonify(cache.stats())
+
+@app.route('/admin/profiling')
+def profiling_summary():
+    if not session.get('admin_logged_in'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    return jsonify(profiler.summary())
+
+@app.route('/admin/profiling/flamegraph')
+def profiling_flamegraph():
+    if not session.get('admin_logged_in'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    kind = request.args.get('kind', 'cpu')
+    if kind not in ('cpu', 'alloc'):
+        return jsonify({'error': 'kind must be cpu or alloc'}), 400
+    route = request.args.get('route')
+    # Collapsed stacks: feed to flamegraph.pl or drop into speedscope.app
+    filename = f"{kind}-{route or 'all'}".replace(' ', '_').replace('/', '_').strip('_') + '.folded'
+    return Response(profiler.collapsed(kind, route), mimetype='text/plain',
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+@app.route('/admin/profiling/reset', methods=['POST'])
+def profiling_reset():
+    if not session.get('admin_logged_in'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    profiler.reset()
+    return jsonify({'success': True})
+
+@app.route('/admin/api/students/bulk', methods=['POST'])
+def bulk_onboard_students():
+    if not session.get('admin_logged_in'):
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    # CSV as an uploaded file or text/csv body, otherwise JSON
+    try:
+        upload = request.files.get('file')
+        if upload:
+            text = upload.read().decode('utf-8-sig')
+            records = onboarding.parse_json(json.loads(text)) if upload.filename.lower().endswith('.json') \
+                else onboarding.parse_csv(text)
+        elif request.mimetype == 'text/csv':
+            records = onboarding.parse_csv(request.get_data(as_text=True))
+        else:
+            records = onboarding.parse_json(request.get_json(silent=True))
+    except (ValueError, UnicodeDecodeError) as e:
+        return jsonify({'error': str(e)}), 400
+
+    if not records:
+        return jsonify({'error': 'No students in upload'}), 400
+    if len(records) > onboarding.MAX_ROWS:
+        return jsonify({'error': f'At most {onboarding.MAX_ROWS} students per upload'}), 413
+
+    report = onboarding.onboard_students(db, User, ChangeEvent, records, ONBOARDING_HASH_METHOD,
+                                         dry_run=request.args.get('dry_run') == '1')
+    print(f"Bulk onboarding: {report['created']} created, {report['failed']} failed in {report['elapsed_seconds']}s")
+    return jsonify(report)
 
 @app.route('/profile')
 @login_required
 def profile():
     # Simple logic: Just get the first letter of the name
     user_initial = current_user.name[0].upper() if current_user.name else "?"
-    return render_template('profile.html', user=current_user, user_initial=user_initial)
+    image = profile_image_for(current_user.id)
+    avatar_url = image.medium_url if image and image.status == 'READY' else None
+    return render_template('profile.html', user=current_user, user_initial=user_initial, avatar_url=avatar_url)
+
+@app.route('/api/profile/avatar', methods=['POST'])
+@login_required
+def upload_avatar():
+    upload = request.files.get('avatar')
+    if not upload:
+        return jsonify({'error': 'No file uploaded'}), 400
+
+    # Request thread only streams to disk and checks magic bytes; workers decode
+    tmp_path, kind = image_pipeline.spool(upload.stream)
+    if not tmp_path:
+        return jsonify({'error': 'Please upload a JPEG, PNG, GIF or WebP image'}), 400
+
+    version = uuid.uuid4().hex
+    image = profile_image_for(current_user.id)
+    if not image:
+        image = ProfileImage(user_id=current_user.id, version=version)
+        db.session.add(image)
+    old_version = image.version
+    image.version = version
+    image.status = 'PENDING'
+    db.session.commit()
+
+    user_id = current_user.id
+    key_prefix = f"avatars/{user_id}/{version}"
+
+    def on_done(urls, error):
+        with app.app_context():
+            record = ProfileImage.query.filter_by(user_id=user_id).first()
+            # A newer upload may have superseded this one while it was processing
+            if not record or record.version != version:
+                return
+            if error:
+                record.status = 'FAILED'
+            else:
+                record.status = 'READY'
+                record.thumb_url = urls.get('thumb')
+                record.medium_url = urls.get('medium')
+            db.session.commit()
+            if not error and old_version != version:
+                image_pipeline.storage.delete_prefix(f"avatars/{user_id}/{old_version}")
+
+    image_pipeline.submit(tmp_path, key_prefix, on_done)
+    return jsonify({'status': 'PENDING'}), 202
+
+@app.route('/api/profile/avatar', methods=['GET'])
+@login_required
+def avatar_status():
+    image = profile_image_for(current_user.id)
+    if not image:
+        return jsonify({'status': 'NONE'})
+    return jsonify(image.as_dict())
 
 @app.route('/my-plan')
 @login_required
 def my_plan():
     # Find latest PAID payment for this user by phone
     # We use phone because email might not be reliable if they changed it, but phone is our key linker now
-    latest_payment = Payment.query.filter_by(student_phone=current_user.phone, status='PAID')\
-        .order_by(Payment.id.desc()).first()
-    
-    # If no real payment, check mock
-    if not latest_payment:
-        latest_payment = Payment.query.filter_by(student_phone=current_user.phone, status='MOCK_PAID')\
-            .order_by(Payment.id.desc()).first()
-            
-    active_plan = None
-    if latest_payment:
-        active_plan = {
-            'name': latest_payment.plan_name,
-            'category': latest_payment.plan_category,
-            'custom_id': latest_payment.custom_id
-        }
+    active_plan = active_plan_for_phone(current_user.phone)
         
     return render_template('my_plans.html', user=current_user, active_plan=active_plan)
 
@@ -631,6 +1286,9 @@ def delete_order(order_id):
     order = Payment.query.get(order_id)
     if order:
         db.session.delete(order)
+        if order.student_email:
+            db.session.flush()
+            refresh_purchase_rollup(order.student_email)
         db.session.commit()
         return jsonify({'success': True})
     return jsonify({'error': 'Order not found'}), 404
@@ -642,12 +1300,20 @@ def delete_all_items(item_type):
     
     try:
         if item_type == 'user':
+            # Bulk deletes skip ORM cascades, so clear dependent rows first
+            db.session.query(ProfileImage).delete()
             num_deleted = db.session.query(User).delete()
+            db.session.add(ChangeEvent(entity='user', op='reset'))
             db.session.commit()
+            cache.invalidate_namespace('user')
             return jsonify({'success': True, 'count': num_deleted})
         elif item_type == 'order':
             num_deleted = db.session.query(Payment).delete()
+            # Rollups point at payment ids, which SQLite reuses after a wipe
+            db.session.query(PurchaseRollup).delete()
+            db.session.add(ChangeEvent(entity='payment', op='reset'))
             db.session.commit()
+            cache.invalidate_namespace('entitlement')
             return jsonify({'success': True, 'count': num_deleted})
         else:
             return jsonify({'error': 'Invalid item type'}), 400
@@ -670,12 +1336,14 @@ def refund():
 # ------------------------------------------------------------------------------
 # Helper Functions
 # ------------------------------------------------------------------------------
-def save_order(student, plan, transaction_id, status='PAID', amount=0):
-    file_exists = os.path.isfile('orders.csv')
+def save_order(student, plan, transaction_id, status='PAID', amount=0, path=None):
+    path = path or ORDERS_LEDGER_PATH
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    file_exists = os.path.isfile(path)
     timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     row = [timestamp, student.get('name'), student.get('email'), student.get('phone'), plan.get('name'), plan.get('category'), amount, status, transaction_id]
     
-    with open('orders.csv', 'a', newline='', encoding='utf-8') as f:
+    with open(path, 'a', newline='', encoding='utf-8') as f:
         writer = csv.writer(f)
         if not file_exists:
             writer.writerow(['Timestamp', 'Name', 'Email', 'Phone', 'Plan Name', 'Category', 'Amount', 'Status', 'Transaction/Order ID'])
@@ -0,0 +1,93 @@
+"""
+Headless time-to-first-render benchmark for the landing page.
+
+Serves the app on a local port and loads "/" in headless Chromium (Playwright)
+with the critical-CSS path on and off (?critical=0), reporting median
+first-paint / first-contentful-paint and DOMContentLoaded over several runs.
+
+    pip install playwright && playwright install chromium
+    python bench_first_render.py --runs 15 --throttle     # throttle = "Fast 3G"-ish network
+
+Each run uses a fresh browser context (cold cache).
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db'))
+
+from werkzeug.serving import make_server
+
+from app import app
+
+PAINT_JS = """() => {
+    const paints = Object.fromEntries(performance.getEntriesByType('paint').map(e => [e.name, e.startTime]));
+    const nav = performance.getEntriesByType('navigation')[0];
+    return {
+        fp: paints['first-paint'] ?? null,
+        fcp: paints['first-contentful-paint'] ?? null,
+        dcl: nav ? nav.domContentLoadedEventEnd : null,
+    };
+}"""
+
+# Roughly Chrome DevTools' "Fast 3G" preset
+THROTTLE = {'offline': False, 'latency': 150, 'downloadThroughput': 1.6 * 1024 * 1024 / 8,
+            'uploadThroughput': 750 * 1024 / 8}
+
+
+def measure(browser, url, throttle):
+    context = browser.new_context()
+    page = context.new_page()
+    if throttle:
+        cdp = context.new_cdp_session(page)
+        cdp.send('Network.enable')
+        cdp.send('Network.emulateNetworkConditions', THROTTLE)
+    page.goto(url, wait_until='load')
+    page.wait_for_timeout(200)  # Let paint entries settle
+    result = page.evaluate(PAINT_JS)
+    context.close()
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--port', type=int, default=0)
+    parser.add_argument('--throttle', action='store_true')
+    args = parser.parse_args(argv)
+
+    try:
+        from playwright.sync_api import sync_playwright
+    except ImportError:
+        print("Playwright is not installed: pip install playwright && playwright install chromium")
+        return 1
+
+    server = make_server('127.0.0.1', args.port, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}/"
+
+    variants = {'blocking styles.css': base + '?critical=0', 'critical CSS inlined': base}
+    results = {name: [] for name in variants}
+    try:
+        with sync_playwright() as p:
+            browser = p.chromium.launch()
+            for _ in range(args.runs):
+                # Interleave the variants so drift affects both equally
+                for name, url in variants.items():
+                    results[name].append(measure(browser, url, args.throttle))
+            browser.close()
+    finally:
+        server.shutdown()
+
+    print(f"{'variant':<24}{'FP ms':>10}{'FCP ms':>10}{'DCL ms':>10}   (median of {args.runs})")
+    for name, runs in results.items():
+        medians = [statistics.median([r[k] for r in runs if r[k] is not None] or [0]) for k in ('fp', 'fcp', 'dcl')]
+        print(f"{name:<24}" + ''.join(f"{m:>10.0f}" for m in medians))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,361 @@
+"""
+Two-tier cache shared across gunicorn workers and instances.
+
+    local   per-process LRU with a short TTL, checked first (no network hop)
+    shared  Redis (or anything speaking its protocol) behind it
+
+Writes that change cached data call ``invalidate()``; that replaces the shared
+entry with a short-lived tombstone, drops the local one and publishes a
+message on the invalidation channel so every other process drops its local
+copy too. The short local TTL is the safety net if a message is ever missed
+(e.g. during a reconnect, after which the local tier is cleared entirely).
+
+``get_or_set`` only fills a key that is absent (SET NX), so a reader that
+loaded the row before a write committed can't put the stale value back over
+the tombstone; keys are simply not cached for ``tombstone_ttl`` seconds after
+an invalidation.
+
+``LocalBackend`` implements the same small surface (get/set/add/delete/incr/
+publish/subscribe) in-process, for development and tests; several
+``TwoTierCache`` instances sharing one ``LocalBackend`` behave like several
+workers sharing one Redis. Without a shared backend ``make_cache`` returns a
+``PassThroughCache`` (no caching) unless a single-process local cache is
+explicitly requested, since separate workers would never see each other's
+invalidations.
+
+Values must be JSON-serializable. Hit/miss counters are kept per namespace.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, defaultdict
+
+MISSING = object()
+TOMBSTONE = '~invalidated'  # Never valid JSON, so it can't collide with a cached value
+
+
+# ------------------------------------------------------------------------------
+# Shared Backends
+# ------------------------------------------------------------------------------
+class LocalBackend:
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(list)
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at and expires_at < time.time():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (value, time.time() + ttl if ttl else None)
+
+    def add(self, key, value, ttl=None):
+        # Set only if absent; False when the key exists
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and not (item[1] and item[1] < time.time()):
+                return False
+            self._data[key] = (value, time.time() + ttl if ttl else None)
+            return True
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def incr(self, key):
+        with self._lock:
+            value = int(self._data.get(key, (0, None))[0]) + 1
+            self._data[key] = (str(value), None)
+            return value
+
+    def publish(self, channel, message):
+        for callback in list(self._subscribers[channel]):
+            callback(message)
+
+    def subscribe(self, channel, callback):
+        self._subscribers[channel].append(callback)
+
+
+class RedisBackend:
+    def __init__(self, url):
+        import redis
+        self.client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+
+    def get(self, key):
+        value = self.client.get(key)
+        return value.decode('utf-8') if value is not None else None
+
+    def set(self, key, value, ttl=None):
+        self.client.set(key, value, px=int(ttl * 1000) if ttl else None)
+
+    def add(self, key, value, ttl=None):
+        return bool(self.client.set(key, value, px=int(ttl * 1000) if ttl else None, nx=True))
+
+    def delete(self, key):
+        self.client.delete(key)
+
+    def incr(self, key):
+        return self.client.incr(key)
+
+    def publish(self, channel, message):
+        self.client.publish(channel, message)
+
+    def subscribe(self, channel, callback, on_reconnect=None):
+        def listen():
+            while True:
+                try:
+                    pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                    pubsub.subscribe(channel)
+                    if on_reconnect:
+                        on_reconnect()  # Messages may have been missed while disconnected
+                    for message in pubsub.listen():
+                        callback(message['data'].decode('utf-8'))
+                except Exception as e:
+                    print(f"Cache invalidation subscriber error, reconnecting: {e}")
+                    time.sleep(1)
+        threading.Thread(target=listen, name='cache-invalidation', daemon=True).start()
+
+
+# ------------------------------------------------------------------------------
+# Two-tier Cache
+# ------------------------------------------------------------------------------
+class NamespaceStats:
+    __slots__ = ('local_hits', 'shared_hits', 'misses', 'sets', 'invalidations', 'errors')
+
+    def __init__(self):
+        for field in self.__slots__:
+            setattr(self, field, 0)
+
+    def as_dict(self):
+        data = {field: getattr(self, field) for field in self.__slots__}
+        lookups = self.local_hits + self.shared_hits + self.misses
+        data['hit_ratio'] = round((self.local_hits + self.shared_hits) / lookups, 4) if lookups else None
+        return data
+
+
+class TwoTierCache:
+    def __init__(self, backend, prefix='jeeto', default_ttl=300, local_ttl=30, local_max=2048, tombstone_ttl=5):
+        self.backend = backend
+        self.prefix = prefix
+        self.default_ttl = default_ttl
+        self.local_ttl = local_ttl
+        self.tombstone_ttl = tombstone_ttl
+        self.local_max = local_max
+        self.channel = f"{prefix}:invalidate"
+        self.origin = uuid.uuid4().hex  # Lets us ignore our own published messages
+        self._local = OrderedDict()
+        self._generations = {}
+        self._lock = threading.Lock()
+        self._stats = defaultdict(NamespaceStats)
+
+        if isinstance(backend, RedisBackend):
+            backend.subscribe(self.channel, self._on_message, on_reconnect=self.clear_local)
+        else:
+            backend.subscribe(self.channel, self._on_message)
+
+    # Keys ---------------------------------------------------------------------
+    def _generation(self, namespace):
+        # Namespace-wide invalidation bumps a counter that is part of every key
+        # (re-read after local_ttl in case an invalidation message was missed)
+        cached = self._generations.get(namespace)
+        if cached is None or cached[1] < time.monotonic():
+            gen = self.backend.get(f"{self.prefix}:gen:{namespace}") or '0'
+            cached = (gen, time.monotonic() + self.local_ttl)
+            self._generations[namespace] = cached
+        return cached[0]
+
+    def _key(self, namespace, key):
+        return f"{self.prefix}:{namespace}:{self._generation(namespace)}:{key}"
+
+    # Local tier ---------------------------------------------------------------
+    def _local_get(self, full_key):
+        with self._lock:
+            item = self._local.get(full_key)
+            if item is None:
+                return MISSING
+            value, expires_at = item
+            if expires_at < time.monotonic():
+                del self._local[full_key]
+                return MISSING
+            self._local.move_to_end(full_key)
+            return value
+
+    def _local_set(self, full_key, value):
+        with self._lock:
+            self._local[full_key] = (value, time.monotonic() + self.local_ttl)
+            self._local.move_to_end(full_key)
+            while len(self._local) > self.local_max:
+                self._local.popitem(last=False)
+
+    def _local_drop(self, namespace, key=None):
+        marker = f"{self.prefix}:{namespace}:"
+        with self._lock:
+            if key is None:
+                self._generations.pop(namespace, None)
+            for full_key in [k for k in self._local if k.startswith(marker)]:
+                # Local keys are "<prefix>:<namespace>:<generation>:<key>"
+                if key is None or full_key[len(marker):].split(':', 1)[1] == str(key):
+                    del self._local[full_key]
+
+    def clear_local(self):
+        with self._lock:
+            self._local.clear()
+            self._generations.clear()
+
+    # Public API ---------------------------------------------------------------
+    def get(self, namespace, key, default=None):
+        stats = self._stats[namespace]
+        try:
+            full_key = self._key(namespace, key)
+        except Exception as e:
+            stats.errors += 1
+            print(f"Cache backend error ({namespace}): {e}")
+            return default
+
+        value = self._local_get(full_key)
+        if value is not MISSING:
+            stats.local_hits += 1
+            return value
+
+        try:
+            raw = self.backend.get(full_key)
+        except Exception as e:
+            # Shared tier down: behave like a miss, the caller falls back to the DB
+            stats.errors += 1
+            print(f"Cache backend error ({namespace}): {e}")
+            raw = None
+        if raw is None or raw == TOMBSTONE:
+            stats.misses += 1
+            return default
+        value = json.loads(raw)
+        self._local_set(full_key, value)
+        stats.shared_hits += 1
+        return value
+
+    def set(self, namespace, key, value, ttl=None):
+        stats = self._stats[namespace]
+        try:
+            full_key = self._key(namespace, key)
+            self.backend.set(full_key, json.dumps(value), ttl or self.default_ttl)
+        except Exception as e:
+            stats.errors += 1
+            print(f"Cache backend error ({namespace}): {e}")
+            return
+        self._local_set(full_key, value)
+        stats.sets += 1
+
+    def get_or_set(self, namespace, key, loader, ttl=None):
+        value = self.get(namespace, key, MISSING)
+        if value is MISSING:
+            value = loader()
+            self._fill(namespace, key, value, ttl)
+        return value
+
+    def _fill(self, namespace, key, value, ttl=None):
+        # Like set(), but loses to a tombstone or a newer value: the loaded row may already be stale
+        stats = self._stats[namespace]
+        try:
+            full_key = self._key(namespace, key)
+            if not self.backend.add(full_key, json.dumps(value), ttl or self.default_ttl):
+                return
+        except Exception as e:
+            stats.errors += 1
+            print(f"Cache backend error ({namespace}): {e}")
+            return
+        self._local_set(full_key, value)
+        stats.sets += 1
+
+    def invalidate(self, namespace, key):
+        self._stats[namespace].invalidations += 1
+        self._local_drop(namespace, key)
+        try:
+            self.backend.set(self._key(namespace, key), TOMBSTONE, self.tombstone_ttl)
+            self.backend.publish(self.channel, json.dumps({'ns': namespace, 'key': key, 'origin': self.origin}))
+        except Exception as e:
+            self._stats[namespace].errors += 1
+            print(f"Cache invalidation failed ({namespace}:{key}): {e}")
+
+    def invalidate_namespace(self, namespace):
+        self._stats[namespace].invalidations += 1
+        try:
+            self.backend.incr(f"{self.prefix}:gen:{namespace}")
+            self.backend.publish(self.channel, json.dumps({'ns': namespace, 'key': None, 'origin': self.origin}))
+        except Exception as e:
+            self._stats[namespace].errors += 1
+            print(f"Cache invalidation failed ({namespace}): {e}")
+        self._local_drop(namespace)
+
+    def _on_message(self, message):
+        data = json.loads(message)
+        if data.get('origin') == self.origin:
+            return
+        self._local_drop(data['ns'], data.get('key'))
+
+    def stats(self):
+        return {
+            'pid': os.getpid(),
+            'backend': type(self.backend).__name__,
+            'local_entries': len(self._local),
+            'namespaces': {ns: s.as_dict() for ns, s in sorted(self._stats.items())}
+        }
+
+
+class PassThroughCache:
+    """Same API, caches nothing: every lookup goes to the loader (the database)."""
+
+    def __init__(self):
+        self._stats = defaultdict(NamespaceStats)
+
+    def get(self, namespace, key, default=None):
+        self._stats[namespace].misses += 1
+        return default
+
+    def set(self, namespace, key, value, ttl=None):
+        pass
+
+    def get_or_set(self, namespace, key, loader, ttl=None):
+        self._stats[namespace].misses += 1
+        return loader()
+
+    def invalidate(self, namespace, key):
+        self._stats[namespace].invalidations += 1
+
+    def invalidate_namespace(self, namespace):
+        self._stats[namespace].invalidations += 1
+
+    def clear_local(self):
+        pass
+
+    def stats(self):
+        return {
+            'pid': os.getpid(),
+            'backend': 'none',
+            'local_entries': 0,
+            'namespaces': {ns: s.as_dict() for ns, s in sorted(self._stats.items())}
+        }
+
+
+def make_cache(url=None, local_only=False, **options):
+    """Redis-backed two-tier cache, or caching off entirely when there is no shared backend.
+
+    ``local_only`` keeps an in-process cache without Redis. Invalidations then never
+    leave the process, so it is only correct with a single worker process.
+    """
+    if url:
+        return TwoTierCache(RedisBackend(url), **options)
+    if local_only:
+        print("Cache: in-process only (CACHE_LOCAL_ONLY=1); run a single worker process")
+        return TwoTierCache(LocalBackend(), **options)
+    print("Cache: disabled (set CACHE_URL to enable)")
+    return PassThroughCache()
@@ -0,0 +1,25 @@
+"""
+Shared setup for the tests that import the app.
+
+app.py reads its configuration at import time, so the isolated SQLite DB and
+Razorpay test keys have to be in the environment before the first
+``from app import ...``. pytest loads this file before collecting any test
+module; the test modules also import it first so they still work when run
+directly (``python test_jobs.py``). One database is shared by the whole run,
+so tests use their own ids, emails and phone numbers.
+"""
+import os
+import tempfile
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'test.db'))
+os.environ.setdefault('RAZORPAY_KEY_ID', 'rzp_test_key')
+os.environ.setdefault('RAZORPAY_KEY_SECRET', 'test_secret')
+
+
+def admin_client():
+    """Test client with an admin session."""
+    from app import app
+    client = app.test_client()
+    with client.session_transaction() as s:
+        s['admin_logged_in'] = True
+    return client
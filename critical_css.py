@@ -0,0 +1,171 @@
+"""
+Critical (above-the-fold) CSS extraction for the landing page.
+
+index() inlines the rules that can apply to the markup above the fold and
+loads the full styles.css without blocking first render. The extraction is a
+static approximation (no headless browser at build time): a rule is kept if
+every class, id and tag in at least one of its selectors appears in the
+above-the-fold HTML. Pseudo-classes, attribute selectors and combinators are
+ignored, so it errs on the side of keeping too much. @font-face, @import and
+any @keyframes used by kept rules are carried along; @media/@supports blocks
+are filtered recursively.
+
+    python critical_css.py      # writes critical.css and prints the size saving
+"""
+import os
+import re
+import sys
+
+# Everything in index.html before this marker is "above the fold"
+FOLD_MARKER = '<!-- Meet Your Mentors -->'
+ALWAYS_KEEP = {'*', 'html', 'body', ':root'}
+
+_COMMENT = re.compile(r'/\*.*?\*/', re.S)
+_CLASS = re.compile(r'\.(-?[_a-zA-Z][\w-]*)')
+_ID = re.compile(r'#(-?[_a-zA-Z][\w-]*)')
+_TAG = re.compile(r'^([a-zA-Z][\w-]*)')
+_PSEUDO = re.compile(r'::?[\w-]+(\([^)]*\))?')
+_ATTR = re.compile(r'\[[^\]]*\]')
+_ANIMATION = re.compile(r'animation(?:-name)?\s*:\s*([^;}]+)')
+
+
+# ------------------------------------------------------------------------------
+# Parsing
+# ------------------------------------------------------------------------------
+def parse_blocks(css):
+    """Split CSS into (prelude, body) pairs; body is None for statements like @import."""
+    css = _COMMENT.sub('', css)
+    blocks, i, n = [], 0, len(css)
+    while i < n:
+        j = i
+        quote = None
+        while j < n and (quote or css[j] not in '{;'):
+            if css[j] in '"\'':
+                quote = None if quote == css[j] else (quote or css[j])
+            j += 1
+        prelude = css[i:j].strip()
+        if j >= n:
+            break
+        if css[j] == ';':
+            if prelude:
+                blocks.append((prelude, None))
+            i = j + 1
+            continue
+        depth, k = 1, j + 1
+        while k < n and depth:
+            if css[k] == '{':
+                depth += 1
+            elif css[k] == '}':
+                depth -= 1
+            k += 1
+        blocks.append((prelude, css[j + 1:k - 1]))
+        i = k
+    return blocks
+
+
+def collect_tokens(html):
+    """Classes, ids and tag names used in a chunk of HTML."""
+    classes, ids, tags = set(), set(), set()
+    for match in re.finditer(r'class="([^"]*)"', html):
+        classes.update(match.group(1).split())
+    ids.update(re.findall(r'id="([^"]*)"', html))
+    tags.update(t.lower() for t in re.findall(r'<([a-zA-Z][\w-]*)', html))
+    return classes, ids, tags | {'html', 'body'}
+
+
+# ------------------------------------------------------------------------------
+# Matching
+# ------------------------------------------------------------------------------
+def selector_matches(selector, tokens):
+    classes, ids, tags = tokens
+    selector = selector.strip()
+    if selector in ALWAYS_KEEP:
+        return True
+    cleaned = _ATTR.sub('', _PSEUDO.sub('', selector))
+    for compound in re.split(r'[\s>+~]+', cleaned):
+        if not compound or compound == '*':
+            continue
+        tag = _TAG.match(compound)
+        if tag and tag.group(1).lower() not in tags:
+            return False
+        if any(c not in classes for c in _CLASS.findall(compound)):
+            return False
+        if any(i not in ids for i in _ID.findall(compound)):
+            return False
+    return True
+
+
+def filter_blocks(blocks, tokens, keyframes, used_animations):
+    kept = []
+    for prelude, body in blocks:
+        lowered = prelude.lower()
+        if body is None:
+            if lowered.startswith(('@import', '@charset')):
+                kept.append(f"{prelude};")
+        elif lowered.startswith('@font-face'):
+            kept.append(f"{prelude}{{{body}}}")
+        elif lowered.startswith(('@keyframes', '@-webkit-keyframes')):
+            keyframes[prelude.split()[-1]] = f"{prelude}{{{body}}}"
+        elif lowered.startswith(('@media', '@supports')):
+            inner = filter_blocks(parse_blocks(body), tokens, keyframes, used_animations)
+            if inner:
+                kept.append(f"{prelude}{{{''.join(inner)}}}")
+        elif lowered.startswith('@'):
+            continue
+        elif any(selector_matches(s, tokens) for s in prelude.split(',')):
+            kept.append(f"{prelude}{{{body.strip()}}}")
+            for value in _ANIMATION.findall(body):
+                used_animations.update(re.findall(r'[-\w]+', value))
+    return kept
+
+
+def _minify(css):
+    css = re.sub(r'\s+', ' ', css)
+    return re.sub(r'\s*([{}:;,])\s*', r'\1', css).replace(';}', '}')
+
+
+def extract_critical_css(css, html, fold_marker=FOLD_MARKER):
+    above_fold = html.split(fold_marker, 1)[0]
+    tokens = collect_tokens(above_fold)
+    keyframes, used_animations = {}, set()
+    kept = filter_blocks(parse_blocks(css), tokens, keyframes, used_animations)
+    kept += [rule for name, rule in keyframes.items() if name in used_animations]
+    # Safe to inline inside <style>
+    return _minify(''.join(kept)).replace('</', '<\\/')
+
+
+class CriticalCSS:
+    """Extracted once per process and re-extracted if styles.css or the template changes."""
+
+    def __init__(self, css_path, html_path):
+        self.css_path = css_path
+        self.html_path = html_path
+        self._stamp = None
+        self._css = None
+
+    def get(self):
+        try:
+            stamp = (os.path.getmtime(self.css_path), os.path.getmtime(self.html_path))
+        except OSError:
+            return None
+        if stamp != self._stamp:
+            with open(self.css_path, encoding='utf-8') as f:
+                css = f.read()
+            with open(self.html_path, encoding='utf-8') as f:
+                html = f.read()
+            self._css = extract_critical_css(css, html)
+            self._stamp = stamp
+        return self._css
+
+
+if __name__ == '__main__':
+    root = os.path.dirname(os.path.abspath(__file__))
+    with open(os.path.join(root, 'styles.css'), encoding='utf-8') as f:
+        full = f.read()
+    with open(os.path.join(root, 'index.html'), encoding='utf-8') as f:
+        page = f.read()
+    critical = extract_critical_css(full, page)
+    out = sys.argv[1] if len(sys.argv) > 1 else os.path.join(root, 'critical.css')
+    with open(out, 'w', encoding='utf-8') as f:
+        f.write(critical)
+    print(f"Critical CSS: {len(critical.encode()):,} bytes inlined vs {len(full.encode()):,} bytes render-blocking ({out})")
@@ -0,0 +1,201 @@
+"""
+Connection-pool instrumentation and liveness strategies.
+
+``InstrumentedQueuePool`` is a drop-in QueuePool that times every checkout
+(how long a request waited for a connection) and counts pool timeouts.
+``instrument_engine()`` adds event hooks for connects, invalidations and
+disconnect errors and registers the engine so ``snapshot()`` /
+``prometheus_text()`` can export per-worker numbers.
+
+Liveness modes (DB_LIVENESS):
+
+    pre_ping     SQLAlchemy's pool_pre_ping: one extra round trip on every checkout
+    idle         only ping connections that sat idle in the pool longer than
+                 DB_IDLE_PING_SECONDS; recently used ones are handed out as-is
+    optimistic   never ping; a disconnect error invalidates the pool so the
+                 next checkout gets a fresh connection
+
+In every mode a real disconnect invalidates all connections older than the
+failure, which is what lets the pool recover after a database restart.
+"""
+import os
+import threading
+import time
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool
+
+LIVENESS_MODES = ('pre_ping', 'idle', 'optimistic')
+WAIT_BUCKETS = (0.001, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30)
+
+_engines = {}  # name -> engine
+
+
+class PoolMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.disconnects = 0
+        self.pings = 0
+        self.ping_failures = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.wait_buckets = [0] * (len(WAIT_BUCKETS) + 1)
+        self.slow_wait_seconds = float(os.getenv('DB_POOL_SLOW_WAIT', '0.5'))
+        self._last_slow_warning = 0.0
+
+    def record_wait(self, seconds, timed_out=False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            for i, bound in enumerate(WAIT_BUCKETS):
+                if seconds <= bound:
+                    self.wait_buckets[i] += 1
+                    break
+            else:
+                self.wait_buckets[-1] += 1
+            warn = seconds >= self.slow_wait_seconds and time.monotonic() - self._last_slow_warning > 10
+            if warn:
+                self._last_slow_warning = time.monotonic()
+        if warn:
+            outcome = 'timed out' if timed_out else 'waited'
+            print(f"WARNING: DB pool saturated in worker {os.getpid()}: checkout {outcome} after {seconds:.2f}s")
+
+    def incr(self, field):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+
+class InstrumentedQueuePool(QueuePool):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except exc.TimeoutError:
+            self.metrics.record_wait(time.perf_counter() - start, timed_out=True)
+            raise
+        self.metrics.record_wait(time.perf_counter() - start)
+        return conn
+
+    def recreate(self):
+        # engine.dispose() swaps in a new pool; keep the counters running
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+
+def engine_options(liveness, base):
+    """Engine options for the chosen liveness mode, on top of ``base``."""
+    if liveness not in LIVENESS_MODES:
+        raise ValueError(f"DB_LIVENESS must be one of {', '.join(LIVENESS_MODES)}, got '{liveness}'")
+    options = dict(base)
+    options['pool_pre_ping'] = liveness == 'pre_ping'
+    return options
+
+
+def instrument_engine(engine, name, liveness='pre_ping', idle_ping_seconds=30):
+    pool = engine.pool
+    metrics = getattr(pool, 'metrics', None)
+    if metrics is None:
+        # Not our pool class (e.g. in-memory SQLite); nothing to export
+        return
+    _engines[name] = engine
+
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_connection, connection_record):
+        engine.pool.metrics.incr('connects')
+
+    @event.listens_for(engine, 'checkin')
+    def on_checkin(dbapi_connection, connection_record):
+        if dbapi_connection is not None:
+            connection_record.info['checked_in_at'] = time.monotonic()
+
+    @event.listens_for(engine, 'invalidate')
+    def on_invalidate(dbapi_connection, connection_record, exception):
+        engine.pool.metrics.incr('invalidations')
+
+    @event.listens_for(engine, 'soft_invalidate')
+    def on_soft_invalidate(dbapi_connection, connection_record, exception):
+        engine.pool.metrics.incr('invalidations')
+
+    @event.listens_for(engine, 'handle_error')
+    def on_error(context):
+        if context.is_disconnect:
+            engine.pool.metrics.incr('disconnects')
+
+    if liveness == 'idle':
+        @event.listens_for(engine, 'checkout')
+        def ping_if_idle(dbapi_connection, connection_record, connection_proxy):
+            checked_in_at = connection_record.info.get('checked_in_at')
+            if checked_in_at is None or time.monotonic() - checked_in_at < idle_ping_seconds:
+                return  # Brand new or recently used: skip the round trip
+            engine.pool.metrics.incr('pings')
+            cursor = dbapi_connection.cursor()
+            try:
+                cursor.execute('SELECT 1')
+            except Exception as e:
+                engine.pool.metrics.incr('ping_failures')
+                # Makes the pool discard this connection and retry the checkout with a fresh one
+                raise exc.DisconnectionError(f"Idle connection failed liveness check: {e}")
+            finally:
+                try:
+                    cursor.close()
+                except Exception:
+                    pass
+
+
+# ------------------------------------------------------------------------------
+# Export
+# ------------------------------------------------------------------------------
+def snapshot():
+    """Current pool numbers for every instrumented engine in this worker."""
+    pools = {}
+    for name, engine in _engines.items():
+        pool, m = engine.pool, engine.pool.metrics
+        with m._lock:
+            pools[name] = {
+                'size': pool.size(),
+                'checked_out': pool.checkedout(),
+                'overflow': max(0, pool.overflow()),
+                'idle': pool.checkedin(),
+                'checkouts': m.checkouts,
+                'timeouts': m.timeouts,
+                'connects': m.connects,
+                'invalidations': m.invalidations,
+                'disconnects': m.disconnects,
+                'pings': m.pings,
+                'ping_failures': m.ping_failures,
+                'wait_seconds_total': round(m.wait_total, 6),
+                'wait_seconds_max': round(m.wait_max, 6),
+                'wait_seconds_buckets': dict(zip([str(b) for b in WAIT_BUCKETS] + ['+Inf'], m.wait_buckets)),
+            }
+    return {'pid': os.getpid(), 'pools': pools}
+
+
+def prometheus_text():
+    data = snapshot()
+    lines = []
+    for name, stats in data['pools'].items():
+        labels = f'pool="{name}",pid="{data["pid"]}"'
+        for key in ('size', 'checked_out', 'overflow', 'idle'):
+            lines.append(f'db_pool_{key}{{{labels}}} {stats[key]}')
+        for key in ('checkouts', 'timeouts', 'connects', 'invalidations', 'disconnects', 'pings', 'ping_failures'):
+            lines.append(f'db_pool_{key}_total{{{labels}}} {stats[key]}')
+        cumulative = 0
+        for bound, count in stats['wait_seconds_buckets'].items():
+            cumulative += count
+            lines.append(f'db_pool_wait_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'db_pool_wait_seconds_sum{{{labels}}} {stats["wait_seconds_total"]}')
+        lines.append(f'db_pool_wait_seconds_count{{{labels}}} {cumulative}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,211 @@
+"""
+Read-replica routing for the Flask-SQLAlchemy session.
+
+Everything goes to the primary by default. Heavy read-only paths (admin
+dashboard, exports, reporting scripts) opt in with the ``replica_reads``
+decorator or the ``use_replica()`` context manager, and their SELECTs are then
+spread over the configured replicas. Writes, flushes and any read that happens
+after the session has written stay on the primary (read-after-write).
+
+Replica lag is measured with a heartbeat row: a single writer (the worker
+process, see worker.py) stamps ``replica_heartbeat`` on the primary every
+``REPLICA_HEARTBEAT_INTERVAL`` seconds, so a replica's copy of the row is
+never older than its replication lag plus one interval. Lag is the age of
+that copy minus the interval. Web processes only read it. A replica that is
+further behind than ``REPLICA_MAX_LAG`` seconds, or that can't be reached, is
+skipped and the read falls back to the primary (as it also does if no
+heartbeat writer is running).
+"""
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+import sqlalchemy as sa
+from flask import current_app, g, has_app_context
+from flask_sqlalchemy.session import Session
+
+heartbeat_table = sa.Table(
+    'replica_heartbeat', sa.MetaData(),
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('beat_at', sa.Float, nullable=False),
+)
+
+
+def _resolve_url(url, instance_path):
+    # Same rule Flask-SQLAlchemy applies to the primary: relative SQLite paths live in the instance folder
+    if url.startswith("postgres://"):
+        url = url.replace("postgres://", "postgresql://", 1)
+    parsed = sa.engine.make_url(url)
+    if parsed.drivername.startswith('sqlite') and parsed.database \
+            and parsed.database != ':memory:' and not os.path.isabs(parsed.database):
+        os.makedirs(instance_path, exist_ok=True)
+        parsed = parsed.set(database=os.path.join(instance_path, parsed.database))
+    return parsed
+
+
+class ReplicaRouter:
+    def __init__(self):
+        self.primary = None
+        self.replicas = []
+        self.max_lag = 10.0
+        self.check_interval = 2.0
+        self.heartbeat_interval = 1.0
+        self._heartbeat_thread = None
+        self._status = {}  # replica index -> (checked_at, lag in seconds)
+        self._checking = set()  # Replica indexes with a lag check in flight
+        self._lock = threading.Lock()
+        self._round_robin = itertools.count()
+
+    def init_app(self, app, db):
+        urls = app.config.get('SQLALCHEMY_REPLICA_URIS') or []
+        options = app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})
+        self.max_lag = float(app.config.get('REPLICA_MAX_LAG', self.max_lag))
+        self.check_interval = float(app.config.get('REPLICA_CHECK_INTERVAL', self.check_interval))
+        self.heartbeat_interval = float(app.config.get('REPLICA_HEARTBEAT_INTERVAL', self.heartbeat_interval))
+        self.replicas = [sa.create_engine(_resolve_url(u, app.instance_path), **options) for u in urls if u]
+        app.extensions['replica_router'] = self
+
+        if self.replicas:
+            with app.app_context():
+                self.primary = db.engine
+                heartbeat_table.create(self.primary, checkfirst=True)
+            print(f"Read replicas enabled: {len(self.replicas)} configured (max lag {self.max_lag}s)")
+
+    # --------------------------------------------------------------------------
+    # Lag checks
+    # --------------------------------------------------------------------------
+    def beat(self, now=None):
+        """Stamp the primary heartbeat row and return the stamped time."""
+        now = now or time.time()
+        with self.primary.begin() as conn:
+            updated = conn.execute(
+                heartbeat_table.update().where(heartbeat_table.c.id == 1).values(beat_at=now)
+            ).rowcount
+            if not updated:
+                conn.execute(heartbeat_table.insert().values(id=1, beat_at=now))
+        return now
+
+    def start_heartbeat(self):
+        """Keep stamping the primary so replica beats measure lag, not idle time.
+
+        Run this in exactly one process (worker.py does): every writer adds a
+        write per interval on the same primary row.
+        """
+        if not self.replicas or self.heartbeat_interval <= 0 or self._heartbeat_thread is not None:
+            return
+
+        def run():
+            while True:
+                try:
+                    self.beat()
+                except Exception as e:
+                    print(f"Replica heartbeat failed: {e}")
+                time.sleep(self.heartbeat_interval)
+
+        self._heartbeat_thread = threading.Thread(target=run, name='replica-heartbeat', daemon=True)
+        self._heartbeat_thread.start()
+
+    def _read_beat(self, engine):
+        with engine.connect() as conn:
+            return conn.execute(
+                sa.select(heartbeat_table.c.beat_at).where(heartbeat_table.c.id == 1)
+            ).scalar()
+
+    def lag(self, index):
+        """Seconds replica ``index`` is behind the primary (inf if unknown)."""
+        try:
+            replica_beat = self._read_beat(self.replicas[index])
+        except Exception as e:
+            print(f"Replica {index} lag check failed: {e}")
+            return float('inf')
+        if replica_beat is None:
+            return float('inf')
+        # The newest beat may simply not have been written yet
+        return max(0.0, time.time() - replica_beat - self.heartbeat_interval)
+
+    def is_healthy(self, index):
+        now = time.time()
+        with self._lock:
+            checked_at, lag = self._status.get(index, (0.0, None))
+            # One request re-checks; concurrent ones use the last result (unhealthy if there is none yet)
+            claimed = now - checked_at >= self.check_interval and index not in self._checking
+            if claimed:
+                self._checking.add(index)
+        if claimed:
+            # Network round trip happens outside the lock
+            try:
+                lag = self.lag(index)
+            finally:
+                with self._lock:
+                    self._status[index] = (now, lag)
+                    self._checking.discard(index)
+        return lag is not None and lag <= self.max_lag
+
+    def status(self):
+        """Last measured lag per replica, for admin/health output."""
+        return {i: lag for i, (_, lag) in sorted(self._status.items())}
+
+    def read_engine(self):
+        """A healthy replica engine, or None to fall back to the primary."""
+        if not self.replicas:
+            return None
+        healthy = [i for i in range(len(self.replicas)) if self.is_healthy(i)]
+        if not healthy:
+            return None
+        return self.replicas[healthy[next(self._round_robin) % len(healthy)]]
+
+
+# ------------------------------------------------------------------------------
+# Opting in
+# ------------------------------------------------------------------------------
+def _replica_requested():
+    return has_app_context() and g.get('_db_use_replica', False)
+
+
+@contextmanager
+def use_replica():
+    """Send read-only queries inside the block to a replica when one is healthy."""
+    previous = g.get('_db_use_replica', False)
+    g._db_use_replica = True
+    try:
+        yield
+    finally:
+        g._db_use_replica = previous
+
+
+def replica_reads(view):
+    """Route decorator: the view's SELECTs may be served by a replica."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        with use_replica():
+            return view(*args, **kwargs)
+    return wrapper
+
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and clause is not None and getattr(clause, 'is_select', False)
+                and not self._flushing and not self.info.get('wrote') and _replica_requested()):
+            router = current_app.extensions.get('replica_router')
+            engine = router.read_engine() if router else None
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@sa.event.listens_for(RoutingSession, 'after_flush')
+def _pin_to_primary(session, flush_context):
+    # Once this session has written, its later reads must see those writes
+    session.info['wrote'] = True
+
+
+@sa.event.listens_for(RoutingSession, 'do_orm_execute')
+def _pin_on_bulk_write(orm_execute_state):
+    if orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert:
+        orm_execute_state.session.info['wrote'] = True
+
+
+replica_router = ReplicaRouter()
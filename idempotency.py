@@ -0,0 +1,70 @@
+"""
+In-process helpers for idempotent endpoints.
+
+RecentResults  bounded, TTL'd map of idempotency key -> stored outcome, so
+               repeated submissions in the same worker never reach the DB.
+KeyedLocks     one lock per key, so concurrent duplicates inside a worker
+               queue behind the first request instead of racing it.
+
+Cross-worker exactly-once is still enforced by the unique key in the DB;
+these only make the common duplicate cheap.
+"""
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class RecentResults:
+    def __init__(self, max_entries=10000, ttl=600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            stored_at, value = item
+            if time.monotonic() - stored_at > self.ttl:
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = (time.monotonic(), value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+    def __len__(self):
+        return len(self._items)
+
+
+class KeyedLocks:
+    def __init__(self):
+        self._locks = {}  # key -> [lock, waiters]
+        self._guard = threading.Lock()
+
+    @contextmanager
+    def hold(self, key):
+        with self._guard:
+            entry = self._locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        entry[0].acquire()
+        try:
+            yield
+        finally:
+            entry[0].release()
+            with self._guard:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._locks[key]
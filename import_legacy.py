@@ -0,0 +1,350 @@
+"""
+Bulk import of the legacy CSV files into the database.
+
+    python import_legacy.py orders orders.csv
+    python import_legacy.py leads leads.csv --batch-size 20000
+    python import_legacy.py orders --synthetic 1000000      # benchmark on generated rows
+
+Rows are streamed, validated and normalized, then written in batches:
+Postgres stages each batch with COPY and merges it with INSERT ... ON CONFLICT,
+other databases use a single executemany INSERT ... ON CONFLICT per batch.
+
+Orders get a deterministic custom_id (the real one when the CSV has it, else a
+hash of the row) so re-running an import never duplicates rows; leads are
+upserted on their normalized phone number, newest submission wins.
+
+Progress is checkpointed after every committed batch to <file>.checkpoint,
+so an interrupted import resumes where it stopped. Rejected rows are written
+to <file>.rejects.csv with the reason. Both go to IMPORT_STATE_DIR (default
+instance/imports), never next to the source: the legacy CSVs live in the app
+root and the rejects carry student PII.
+"""
+import argparse
+import csv
+import datetime
+import hashlib
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app import app, cache, db, Payment, Lead
+from onboarding import normalize_phone
+
+ORDER_COLUMNS = ['Timestamp', 'Name', 'Email', 'Phone', 'Plan Name', 'Category', 'Amount', 'Status', 'Transaction/Order ID']
+LEAD_COLUMNS = ['Timestamp', 'Name', 'Phone', 'Class/Grade', 'Message']
+IMPORT_STATE_DIR = os.getenv('IMPORT_STATE_DIR', os.path.join(app.instance_path, 'imports'))
+
+# Legacy CSV status -> Payment.status
+STATUS_MAP = {
+    'started': 'INIT',
+    'init': 'INIT',
+    'created': 'CREATED',
+    'attempted': 'ATTEMPTED',
+    'paid': 'PAID',
+    'mock_paid': 'MOCK_PAID',
+}
+
+
+# ------------------------------------------------------------------------------
+# Validation / Normalization
+# ------------------------------------------------------------------------------
+def parse_timestamp(value):
+    try:
+        return datetime.datetime.strptime(value.strip(), "%Y-%m-%d %H:%M:%S")
+    except (AttributeError, ValueError):
+        raise ValueError(f"invalid timestamp '{value}'")
+
+
+def clean(value, limit):
+    value = (value or '').strip()
+    return value[:limit] or None
+
+
+def normalize_order(row):
+    timestamp = parse_timestamp(row['Timestamp'])
+    # Stored as typed, like live payments: entitlement queries compare Payment.student_email exactly
+    email = clean(row['Email'], 100)
+    phone = normalize_phone(row['Phone']) if (row['Phone'] or '').strip() else None
+    if not email and not phone:
+        raise ValueError("no email or phone")
+
+    status = STATUS_MAP.get((row['Status'] or '').strip().lower())
+    if not status:
+        raise ValueError(f"unknown status '{row['Status']}'")
+    try:
+        amount = float(row['Amount'] or 0)
+    except ValueError:
+        raise ValueError(f"invalid amount '{row['Amount']}'")
+
+    reference = (row['Transaction/Order ID'] or '').strip()
+    payment_id = reference if reference.startswith('pay_') else None
+    if reference.startswith('#'):
+        custom_id = reference[:50]
+    else:
+        # No real order ID in the legacy file: derive a stable one so re-imports dedupe
+        fingerprint = '|'.join([row['Timestamp'], (email or '').lower(), phone or '', row['Plan Name'] or '', reference])
+        custom_id = 'LEGACY_' + hashlib.sha1(fingerprint.encode('utf-8')).hexdigest()[:16]
+
+    return {
+        'custom_id': custom_id,
+        'status': status,
+        'amount': amount,
+        'currency': 'INR',
+        'student_name': clean(row['Name'], 100),
+        'student_email': email,
+        'student_phone': phone,
+        'plan_name': clean(row['Plan Name'], 100),
+        'plan_category': clean(row['Category'], 50),
+        'razorpay_payment_id': payment_id,
+        'timestamp': timestamp,
+    }
+
+
+def normalize_lead(row):
+    return {
+        'phone': normalize_phone(row['Phone']),
+        'name': clean(row['Name'], 100),
+        'class_grade': clean(row['Class/Grade'], 50),
+        'message': clean(row['Message'], 5000),
+        'timestamp': parse_timestamp(row['Timestamp']),
+    }
+
+
+KINDS = {
+    # 'skip_existing': rows whose value in this (non-unique) column is already in the table are dropped;
+    # the live app's ledger writes razorpay_payment_id for payments that already have a row
+    'orders': {'model': Payment, 'columns': ORDER_COLUMNS, 'normalize': normalize_order, 'key': 'custom_id', 'update': [],
+               'skip_existing': 'razorpay_payment_id'},
+    'leads': {'model': Lead, 'columns': LEAD_COLUMNS, 'normalize': normalize_lead, 'key': 'phone',
+              'update': ['name', 'class_grade', 'message', 'timestamp'], 'skip_existing': None},
+}
+
+
+# ------------------------------------------------------------------------------
+# Batch Writers
+# ------------------------------------------------------------------------------
+def _dedupe(rows, key):
+    # Last occurrence wins; a single ON CONFLICT statement can't touch the same key twice
+    return list({row[key]: row for row in rows}.values())
+
+
+def _dedupe_optional(rows, column):
+    # Rows without a value are all kept
+    seen = {}
+    for row in rows:
+        if row[column]:
+            seen[row[column]] = row
+    return [row for row in rows if not row[column] or seen[row[column]] is row]
+
+
+def drop_existing(conn, spec, rows):
+    column = spec['model'].__table__.c[spec['skip_existing']]
+    values = {row[column.name] for row in rows if row[column.name]}
+    if not values:
+        return rows
+    existing = set(conn.execute(select(column).where(column.in_(values))).scalars())
+    return [row for row in rows if row[column.name] not in existing]
+
+
+def write_batch_executemany(conn, spec, rows):
+    table = spec['model'].__table__
+    if spec['skip_existing']:
+        rows = drop_existing(conn, spec, rows)
+        if not rows:
+            return
+    dialect = postgresql if conn.dialect.name == 'postgresql' else sqlite
+    stmt = dialect.insert(table)
+    if spec['update']:
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[spec['key']],
+            set_={col: stmt.excluded[col] for col in spec['update']},
+            where=table.c.timestamp <= stmt.excluded.timestamp
+        )
+    else:
+        stmt = stmt.on_conflict_do_nothing(index_elements=[spec['key']])
+    conn.execute(stmt, rows)
+
+
+def write_batch_copy(conn, spec, rows):
+    table = spec['model'].__table__.name
+    columns = list(rows[0].keys())
+    column_list = ', '.join(f'"{c}"' for c in columns)
+    key = spec['key']
+
+    conn.exec_driver_sql(
+        f'CREATE TEMP TABLE IF NOT EXISTS import_stage_{table} AS SELECT {column_list} FROM "{table}" WITH NO DATA'
+    )
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for row in rows:
+        writer.writerow([row[c].isoformat() if isinstance(row[c], datetime.datetime) else row[c] for c in columns])
+    buf.seek(0)
+    cursor = conn.connection.dbapi_connection.cursor()
+    cursor.copy_expert(f'COPY import_stage_{table} ({column_list}) FROM STDIN WITH (FORMAT csv)', buf)
+
+    if spec['update']:
+        updates = ', '.join(f'"{c}" = EXCLUDED."{c}"' for c in spec['update'])
+        conflict = f'DO UPDATE SET {updates} WHERE "{table}"."timestamp" <= EXCLUDED."timestamp"'
+    else:
+        conflict = 'DO NOTHING'
+    skip = ''
+    if spec['skip_existing']:
+        column = spec['skip_existing']
+        skip = (f'WHERE NOT EXISTS (SELECT 1 FROM "{table}" existing '
+                f'WHERE existing."{column}" = import_stage_{table}."{column}") ')
+    conn.exec_driver_sql(
+        f'INSERT INTO "{table}" ({column_list}) '
+        f'SELECT DISTINCT ON ("{key}") {column_list} FROM import_stage_{table} {skip}ORDER BY "{key}" '
+        f'ON CONFLICT ("{key}") {conflict}'
+    )
+    conn.exec_driver_sql(f'TRUNCATE import_stage_{table}')
+
+
+def write_batch(engine, spec, rows):
+    rows = _dedupe(rows, spec['key'])
+    if spec['skip_existing']:
+        rows = _dedupe_optional(rows, spec['skip_existing'])
+    with engine.begin() as conn:
+        if conn.dialect.name == 'postgresql':
+            write_batch_copy(conn, spec, rows)
+        else:
+            write_batch_executemany(conn, spec, rows)
+
+
+# ------------------------------------------------------------------------------
+# Checkpointing
+# ------------------------------------------------------------------------------
+def load_checkpoint(path, source):
+    if not os.path.exists(path):
+        return 0
+    with open(path) as f:
+        state = json.load(f)
+    if state.get('source') != os.path.abspath(source):
+        return 0
+    return state.get('rows_done', 0)
+
+
+def state_path(source, suffix):
+    os.makedirs(IMPORT_STATE_DIR, exist_ok=True)
+    return os.path.join(IMPORT_STATE_DIR, os.path.basename(source) + suffix)
+
+
+def save_checkpoint(path, source, rows_done):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({'source': os.path.abspath(source), 'rows_done': rows_done,
+                   'updated_at': datetime.datetime.now().isoformat()}, f)
+    os.replace(tmp_path, path)
+
+
+# ------------------------------------------------------------------------------
+# Import
+# ------------------------------------------------------------------------------
+def run_import(kind, path, batch_size=10000, checkpoint_path=None, rejects_path=None, quiet=False):
+    spec = KINDS[kind]
+    checkpoint_path = checkpoint_path or state_path(path, '.checkpoint')
+    rejects_path = rejects_path or state_path(path, '.rejects.csv')
+    skip = load_checkpoint(checkpoint_path, path)
+    if skip and not quiet:
+        print(f"Resuming {path} after {skip} rows")
+
+    stats = {'read': 0, 'imported': 0, 'rejected': 0, 'skipped': skip}
+    started = last_report = time.perf_counter()
+    batch = []
+
+    with app.app_context(), open(path, newline='', encoding='utf-8') as f, \
+            open(rejects_path, 'a', newline='', encoding='utf-8') as rejects_file:
+        engine = db.engine
+        rejects = csv.writer(rejects_file)
+        reader = csv.DictReader(f)
+        missing = set(spec['columns']) - set(reader.fieldnames or [])
+        if missing:
+            raise SystemExit(f"{path} is missing columns: {', '.join(sorted(missing))}")
+
+        for line_no, row in enumerate(reader, start=1):
+            if line_no <= skip:
+                continue
+            stats['read'] += 1
+            try:
+                batch.append(spec['normalize'](row))
+            except ValueError as e:
+                stats['rejected'] += 1
+                rejects.writerow([line_no, str(e)] + [row.get(c) for c in spec['columns']])
+
+            if len(batch) >= batch_size:
+                write_batch(engine, spec, batch)
+                stats['imported'] += len(batch)
+                batch = []
+                rows_done = line_no
+                save_checkpoint(checkpoint_path, path, rows_done)
+                now = time.perf_counter()
+                if not quiet and now - last_report >= 2:
+                    print(f"  {rows_done} rows, {stats['read'] / (now - started):,.0f} rows/sec")
+                    last_report = now
+
+        if batch:
+            write_batch(engine, spec, batch)
+            stats['imported'] += len(batch)
+        rows_done = skip + stats['read']
+        save_checkpoint(checkpoint_path, path, rows_done)
+
+    if kind == 'orders':
+        # Core inserts bypass the ORM invalidation hooks; drop cached entitlements wholesale
+        cache.invalidate_namespace('entitlement')
+
+    elapsed = time.perf_counter() - started
+    stats['seconds'] = round(elapsed, 2)
+    stats['rows_per_sec'] = round(stats['read'] / elapsed) if elapsed else 0
+    if not quiet:
+        print(f"Imported {kind} from {path}: {stats['read']} read, {stats['imported']} valid, "
+              f"{stats['rejected']} rejected in {elapsed:.1f}s ({stats['rows_per_sec']:,} rows/sec)")
+        if stats['rejected']:
+            print(f"Rejected rows written to {rejects_path}")
+    return stats
+
+
+def make_synthetic(kind, path, count):
+    """Write a legacy-format CSV with ``count`` plausible rows (for benchmarking)."""
+    base = datetime.datetime(2026, 1, 1)
+    plans = [('Standard Plan - April Attempt', 'april', 499), ('Elite Plan - April + Boards', 'april-boards', 999)]
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(KINDS[kind]['columns'])
+        for i in range(count):
+            ts = (base + datetime.timedelta(seconds=i)).strftime("%Y-%m-%d %H:%M:%S")
+            phone = f"9{i:09d}"
+            if kind == 'orders':
+                plan, category, price = random.choice(plans)
+                writer.writerow([ts, f"Student {i}", f"student{i}@example.com", phone, plan, category,
+                                 price, random.choice(['Started', 'PAID']), f"pay_synth{i}"])
+            else:
+                writer.writerow([ts, f"Student {i}", phone, random.choice(['11th', '12th', 'Dropper']), ''])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import legacy orders.csv / leads.csv into the database")
+    parser.add_argument('kind', choices=sorted(KINDS))
+    parser.add_argument('path', nargs='?', help="CSV file (defaults to orders.csv / leads.csv)")
+    parser.add_argument('--batch-size', type=int, default=10000)
+    parser.add_argument('--checkpoint', help="Checkpoint file (default: IMPORT_STATE_DIR/<file>.checkpoint)")
+    parser.add_argument('--rejects', help="Where to write rejected rows (default: IMPORT_STATE_DIR/<file>.rejects.csv)")
+    parser.add_argument('--synthetic', type=int, metavar='N', help="Generate N rows into a temp file and import them")
+    args = parser.parse_args(argv)
+
+    path = args.path or f"{args.kind}.csv"
+    if args.synthetic:
+        path = os.path.join(tempfile.mkdtemp(), f"synthetic_{args.kind}.csv")
+        print(f"Generating {args.synthetic} synthetic {args.kind} rows in {path}")
+        make_synthetic(args.kind, path, args.synthetic)
+    return run_import(args.kind, path, args.batch_size, args.checkpoint, args.rejects)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
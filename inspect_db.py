@@ -1,6 +1,8 @@
 from app import app, db, Payment, User
+from db_routing import use_replica
 
-with app.app_context():
+# Reporting reads go to a replica when DATABASE_REPLICA_URLS is set
+with app.app_context(), use_replica():
     print("--- USERS ---")
     users = User.query.all()
     for u in users:
@@ -0,0 +1,172 @@
+"""
+Lightweight durable job queue backed by the app database.
+
+Jobs are rows in the ``job`` table. ``enqueue()`` only adds the row to the
+current session, so it commits atomically with whatever state change caused
+it (e.g. a payment being marked PAID). A separate worker process
+(``python worker.py``) claims due jobs with a compare-and-set UPDATE, runs the
+registered handler and either marks the job DONE, schedules a retry with
+exponential backoff, or moves it to DEAD once ``max_attempts`` is used up.
+Jobs whose worker died mid-run are picked up again after ``lease_seconds``.
+"""
+import datetime
+import json
+import os
+import random
+import socket
+import time
+
+from sqlalchemy import or_
+
+
+def utcnow():
+    return datetime.datetime.utcnow()
+
+
+class JobQueue:
+    def __init__(self, db, model, max_attempts=5, backoff_base=10, backoff_cap=3600, lease_seconds=300):
+        self.db = db
+        self.Job = model
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.lease_seconds = lease_seconds
+        self.handlers = {}
+        self.periodic = {}  # kind -> (interval seconds, payload)
+        self._last_slot = {}
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+
+    def handler(self, kind):
+        """Decorator registering ``func(payload)`` as the handler for ``kind``."""
+        def register(func):
+            self.handlers[kind] = func
+            return func
+        return register
+
+    def every(self, seconds, kind, payload=None):
+        """Have the worker enqueue ``kind`` once per ``seconds`` (deduped across workers)."""
+        self.periodic[kind] = (seconds, payload or {})
+
+    def enqueue(self, kind, payload, dedupe_key=None, delay=0):
+        """Add a job to the current session (committed by the caller)."""
+        Job = self.Job
+        if dedupe_key and Job.query.filter_by(dedupe_key=dedupe_key).first():
+            return None
+        job = Job(
+            kind=kind,
+            payload=json.dumps(payload),
+            dedupe_key=dedupe_key,
+            max_attempts=self.max_attempts,
+            run_at=utcnow() + datetime.timedelta(seconds=delay)
+        )
+        self.db.session.add(job)
+        return job
+
+    # --------------------------------------------------------------------------
+    # Worker side
+    # --------------------------------------------------------------------------
+    def _claimable(self, now):
+        Job = self.Job
+        lease_expired = now - datetime.timedelta(seconds=self.lease_seconds)
+        return or_(
+            (Job.state == 'QUEUED') & (Job.run_at <= now),
+            (Job.state == 'RUNNING') & (Job.locked_at < lease_expired)
+        )
+
+    def claim_next(self):
+        Job = self.Job
+        now = utcnow()
+        candidates = Job.query.filter(self._claimable(now)).order_by(Job.run_at).limit(10).all()
+        for candidate in candidates:
+            # Compare-and-set so two workers never run the same job
+            claimed = Job.query.filter(Job.id == candidate.id, self._claimable(now)).update({
+                'state': 'RUNNING',
+                'locked_by': self.worker_id,
+                'locked_at': now,
+                'attempts': Job.attempts + 1
+            }, synchronize_session=False)
+            self.db.session.commit()
+            if claimed:
+                return self.db.session.get(Job, candidate.id, populate_existing=True)
+        return None
+
+    def backoff(self, attempts):
+        delay = min(self.backoff_cap, self.backoff_base * (2 ** (attempts - 1)))
+        return delay * random.uniform(0.8, 1.2)
+
+    def run_job(self, job):
+        handler = self.handlers.get(job.kind)
+        try:
+            if not handler:
+                raise LookupError(f"No handler registered for job kind '{job.kind}'")
+            handler(json.loads(job.payload))
+        except Exception as e:
+            self.db.session.rollback()
+            job = self.db.session.get(self.Job, job.id)
+            job.last_error = f"{type(e).__name__}: {e}"[:1000]
+            job.locked_by = None
+            if job.attempts >= job.max_attempts:
+                job.state = 'DEAD'
+                job.finished_at = utcnow()
+                print(f"Job {job.id} ({job.kind}) is DEAD after {job.attempts} attempts: {e}")
+            else:
+                job.state = 'QUEUED'
+                job.run_at = utcnow() + datetime.timedelta(seconds=self.backoff(job.attempts))
+                print(f"Job {job.id} ({job.kind}) failed, retrying at {job.run_at}: {e}")
+            self.db.session.commit()
+            return False
+
+        job.state = 'DONE'
+        job.locked_by = None
+        job.last_error = None
+        job.finished_at = utcnow()
+        self.db.session.commit()
+        return True
+
+    def run_once(self):
+        """Claim and run a single due job. Returns False when nothing was due."""
+        job = self.claim_next()
+        if not job:
+            return False
+        self.run_job(job)
+        return True
+
+    def drain(self):
+        count = 0
+        while self.run_once():
+            count += 1
+        return count
+
+    def enqueue_periodic(self):
+        for kind, (interval, payload) in self.periodic.items():
+            slot = int(time.time() // interval)
+            if self._last_slot.get(kind) == slot:
+                continue
+            self.enqueue(kind, payload, dedupe_key=f"{kind}:{slot}")
+            self.db.session.commit()
+            self._last_slot[kind] = slot
+
+    def run_forever(self, poll_interval=1.0):
+        print(f"Job worker {self.worker_id} started")
+        while True:
+            try:
+                self.enqueue_periodic()
+                if not self.run_once():
+                    time.sleep(poll_interval)
+            except Exception as e:
+                self.db.session.rollback()
+                print(f"Job worker error: {e}")
+                time.sleep(poll_interval)
+            finally:
+                self.db.session.remove()
+
+    def requeue_dead(self, kind=None):
+        """Give DEAD jobs a fresh set of attempts (e.g. after fixing SMTP config)."""
+        Job = self.Job
+        query = Job.query.filter(Job.state == 'DEAD')
+        if kind:
+            query = query.filter(Job.kind == kind)
+        count = query.update({'state': 'QUEUED', 'attempts': 0, 'run_at': utcnow(), 'finished_at': None},
+                             synchronize_session=False)
+        self.db.session.commit()
+        return count
@@ -0,0 +1,333 @@
+"""
+Bulk student onboarding for partner institutes.
+
+    python onboarding.py students.csv                # or students.json
+    python onboarding.py students.csv --dry-run      # validate only
+    python onboarding.py --synthetic 10000           # benchmark on generated rows
+
+Input rows have name, email, phone and (optionally) password; rows without a
+password get a generated one, returned once in the report. The pipeline:
+
+  1. validate/normalize every row (phone -> 10 digits, like import_legacy.py)
+  2. reject duplicates inside the upload, then check email (case-insensitive)
+     and phone (last 10 digits) against existing users with one IN query per
+     chunk instead of one query per row
+  3. hash the surviving passwords in a process pool (the KDF is the dominant
+     cost, ~100 ms per password with werkzeug's default scrypt)
+  4. insert in chunked transactions as hashes come back, with a change-feed
+     row per user so the admin dashboard picks them up
+
+Every rejected row is reported with its 1-based row number and the reason; a
+failed chunk (e.g. a concurrent /api/register took an email) is re-checked and
+retried without the conflicting rows, so one bad row never sinks the batch.
+
+Set ONBOARDING_HASH_METHOD (e.g. ``scrypt:8192:8:1``) to trade KDF cost for
+throughput on large batches; those accounts are re-hashed with the standard
+method on first login.
+"""
+import argparse
+import csv
+import io
+import json
+import multiprocessing
+import os
+import re
+import secrets
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+from sqlalchemy import Index, func, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.schema import CreateIndex
+from werkzeug.security import generate_password_hash
+
+FIELDS = ['name', 'email', 'phone', 'password']
+CHUNK_SIZE = 1000
+MAX_ROWS = 50000
+
+_NON_DIGITS = re.compile(r'\D')
+_EMAIL = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+
+
+# ------------------------------------------------------------------------------
+# Parsing / Validation
+# ------------------------------------------------------------------------------
+def normalize_phone(value):
+    digits = _NON_DIGITS.sub('', value or '')
+    if len(digits) == 12 and digits.startswith('91'):
+        digits = digits[2:]
+    if len(digits) != 10:
+        raise ValueError(f"invalid phone '{value}'")
+    return digits
+
+
+def parse_csv(text):
+    reader = csv.DictReader(io.StringIO(text))
+    # Accept "Name", " Email " etc.
+    reader.fieldnames = [(f or '').strip().lower() for f in reader.fieldnames or []]
+    missing = {'name', 'email', 'phone'} - set(reader.fieldnames)
+    if missing:
+        raise ValueError(f"CSV is missing columns: {', '.join(sorted(missing))}")
+    return list(reader)
+
+
+def parse_json(data):
+    if isinstance(data, dict):
+        data = data.get('students')
+    if not isinstance(data, list):
+        raise ValueError("Expected a list of students or {\"students\": [...]}")
+    return data
+
+
+def load_file(path):
+    with open(path, encoding='utf-8') as f:
+        text = f.read()
+    if path.lower().endswith('.json'):
+        return parse_json(json.loads(text))
+    return parse_csv(text)
+
+
+def validate(row):
+    if not isinstance(row, dict):
+        raise ValueError("row must be an object")
+    name = str(row.get('name') or '').strip()
+    email = str(row.get('email') or '').strip()
+    password = str(row.get('password') or '')
+    if not name:
+        raise ValueError("name is required")
+    if len(name) > 100:
+        raise ValueError("name is longer than 100 characters")
+    if not _EMAIL.match(email) or len(email) > 120:
+        raise ValueError(f"invalid email '{email}'")
+    return {
+        'name': name,
+        'email': email,
+        'phone': normalize_phone(str(row.get('phone') or '')),
+        'password': password,
+        'generated': not password,
+    }
+
+
+def _hash_password(password, method):
+    # Top-level so it can be pickled into the process pool
+    if method:
+        return generate_password_hash(password, method=method)
+    return generate_password_hash(password)
+
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+# ------------------------------------------------------------------------------
+# Onboarding
+# ------------------------------------------------------------------------------
+def phone_key(column, dialect_name):
+    """SQL for the last 10 digits of a stored phone ('+91 98765-43210' -> '9876543210').
+
+    Older accounts were registered with the phone exactly as typed.
+    """
+    digits = column
+    for ch in (' ', '-', '+', '(', ')', '.'):
+        digits = func.replace(digits, ch, '')
+    if dialect_name == 'postgresql':
+        return func.right(digits, 10)
+    return func.substr(digits, -10)
+
+
+def create_lookup_indexes(engine, User):
+    """Expression indexes on lower(email) and the phone key, so find_taken() and login are index lookups.
+
+    create_all() only adds indexes along with new tables, so these are created on every start.
+    """
+    table = User.__table__
+    existing = {index.name: index for index in table.indexes}
+    with engine.begin() as conn:
+        for name, expression in (('ix_user_email_lower', func.lower(table.c.email)),
+                                 ('ix_user_phone_key', phone_key(table.c.phone, engine.dialect.name))):
+            # IF NOT EXISTS: expression indexes aren't reflected, so checkfirst can't see them
+            conn.execute(CreateIndex(existing.get(name) or Index(name, expression), if_not_exists=True))
+
+
+def _taken(conn, expression, values):
+    found = set()
+    for chunk in _chunks(sorted(values), CHUNK_SIZE):
+        found.update(conn.execute(select(expression).where(expression.in_(chunk))).scalars())
+    return found
+
+
+def find_taken(conn, User, emails, phones):
+    """(lowercased emails, 10-digit phones) among ``emails``/``phones`` that existing users already have."""
+    taken_emails = _taken(conn, func.lower(User.email), {e.lower() for e in emails})
+    taken_phones = _taken(conn, phone_key(User.phone, conn.dialect.name), set(phones))
+    return taken_emails, taken_phones
+
+
+def check_conflicts(conn, User, candidates, errors):
+    """Drop candidates whose email or phone is already taken; returns the rest."""
+    taken_emails, taken_phones = find_taken(conn, User, {c['email'] for c in candidates},
+                                            {c['phone'] for c in candidates})
+    kept = []
+    for c in candidates:
+        if c['email'].lower() in taken_emails:
+            errors.append({'row': c['row'], 'error': f"email '{c['email']}' is already registered"})
+        elif c['phone'] in taken_phones:
+            errors.append({'row': c['row'], 'error': f"phone '{c['phone']}' is already registered"})
+        else:
+            kept.append(c)
+    return kept
+
+
+def insert_chunk(engine, User, ChangeEvent, chunk, errors):
+    """Insert one chunk in its own transaction; on a unique conflict, re-check and retry once."""
+    table = User.__table__
+    for attempt in range(2):
+        try:
+            with engine.begin() as conn:
+                if attempt:
+                    chunk = check_conflicts(conn, User, chunk, errors)
+                    if not chunk:
+                        return []
+                rows = [{'name': c['name'], 'email': c['email'], 'phone': c['phone'],
+                         'password_hash': c['password_hash']} for c in chunk]
+                ids = conn.execute(
+                    table.insert().returning(table.c.id, sort_by_parameter_order=True), rows
+                ).scalars().all()
+                conn.execute(ChangeEvent.__table__.insert(),
+                             [{'entity': 'user', 'entity_id': i, 'op': 'upsert'} for i in ids])
+            for c, user_id in zip(chunk, ids):
+                c['id'] = user_id
+            return chunk
+        except IntegrityError:
+            if attempt:
+                raise
+    return []
+
+
+def onboard_students(db, User, ChangeEvent, records, hash_method=None, workers=None,
+                     chunk_size=CHUNK_SIZE, dry_run=False):
+    """Validate, de-duplicate, hash and insert ``records``; returns a report dict."""
+    started = time.perf_counter()
+    errors = []
+    candidates = []
+    seen_emails, seen_phones = {}, {}
+
+    for row_no, record in enumerate(records, start=1):
+        try:
+            student = validate(record)
+        except ValueError as e:
+            errors.append({'row': row_no, 'error': str(e)})
+            continue
+        email_key = student['email'].lower()
+        if email_key in seen_emails:
+            errors.append({'row': row_no, 'error': f"duplicate email in upload (first seen on row {seen_emails[email_key]})"})
+            continue
+        if student['phone'] in seen_phones:
+            errors.append({'row': row_no, 'error': f"duplicate phone in upload (first seen on row {seen_phones[student['phone']]})"})
+            continue
+        seen_emails[email_key] = seen_phones[student['phone']] = row_no
+        student['row'] = row_no
+        candidates.append(student)
+
+    engine = db.engine
+    with engine.connect() as conn:
+        candidates = check_conflicts(conn, User, candidates, errors)
+
+    created = []
+    if candidates and not dry_run:
+        for c in candidates:
+            if c['generated']:
+                c['password'] = secrets.token_urlsafe(9)
+        passwords = [c['password'] for c in candidates]
+        workers = workers or os.cpu_count() or 1
+
+        if workers > 1 and len(candidates) > 50:
+            # Not fork: the web worker runs other threads (image pipeline, cache subscriber,
+            # profiler) whose locks a forked child could inherit mid-use
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('forkserver'))
+            hashes = pool.map(_hash_password, passwords, repeat(hash_method),
+                              chunksize=max(1, min(64, len(passwords) // (workers * 4))))
+        else:
+            pool = None
+            hashes = map(_hash_password, passwords, repeat(hash_method))
+        try:
+            # Hashes come back in order, so each chunk is written while the pool works on the next
+            chunk = []
+            for c, password_hash in zip(candidates, hashes):
+                c['password_hash'] = password_hash
+                chunk.append(c)
+                if len(chunk) >= chunk_size:
+                    created += insert_chunk(engine, User, ChangeEvent, chunk, errors)
+                    chunk = []
+            if chunk:
+                created += insert_chunk(engine, User, ChangeEvent, chunk, errors)
+        finally:
+            if pool:
+                pool.shutdown()
+
+    report_rows = candidates if dry_run else created
+    return {
+        'total': len(records),
+        'created': 0 if dry_run else len(created),
+        'valid': len(candidates) if dry_run else len(created),
+        'failed': len(errors),
+        'dry_run': dry_run,
+        'elapsed_seconds': round(time.perf_counter() - started, 3),
+        'students': [
+            {'row': c['row'], 'id': c.get('id'), 'name': c['name'], 'email': c['email'], 'phone': c['phone'],
+             # Generated passwords are only ever shown here
+             **({'password': c['password']} if c['generated'] and not dry_run else {})}
+            for c in report_rows
+        ],
+        'errors': sorted(errors, key=lambda e: e['row']),
+    }
+
+
+# ------------------------------------------------------------------------------
+# CLI
+# ------------------------------------------------------------------------------
+def make_synthetic(count, offset=0):
+    return [{'name': f"Student {i}", 'email': f"bulk{i}@partner.example.com", 'phone': f"8{i:09d}"}
+            for i in range(offset, offset + count)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('path', nargs='?', help="CSV or JSON file of students")
+    parser.add_argument('--synthetic', type=int, help="Onboard N generated students instead of a file")
+    parser.add_argument('--dry-run', action='store_true')
+    parser.add_argument('--workers', type=int, help="Hashing processes (default: CPU count)")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--report', help="Write created students (with generated passwords) to this CSV")
+    args = parser.parse_args(argv)
+    if not args.path and not args.synthetic:
+        parser.error("a file path or --synthetic N is required")
+
+    from app import app, db, User, ChangeEvent, ONBOARDING_HASH_METHOD
+
+    records = make_synthetic(args.synthetic) if args.synthetic else load_file(args.path)
+    with app.app_context():
+        report = onboard_students(db, User, ChangeEvent, records, ONBOARDING_HASH_METHOD,
+                                  args.workers, args.chunk_size, args.dry_run)
+
+    for error in report['errors']:
+        print(f"  row {error['row']}: {error['error']}")
+    verb = 'valid' if args.dry_run else 'created'
+    rate = report['total'] / report['elapsed_seconds'] if report['elapsed_seconds'] else 0
+    print(f"{report['valid']} {verb}, {report['failed']} failed of {report['total']} "
+          f"in {report['elapsed_seconds']:.1f}s ({rate:,.0f} rows/sec)")
+
+    if args.report and report['students']:
+        with open(args.report, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=['row', 'id', 'name', 'email', 'phone', 'password'])
+            writer.writeheader()
+            writer.writerows(report['students'])
+        print(f"Report written to {args.report}")
+    return 1 if report['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,232 @@
+"""
+Opt-in sampled profiling of live requests.
+
+A fraction of requests (PROFILE_SAMPLE_RATE, 0 = off) is profiled:
+
+    cpu    a single background thread snapshots the stacks of the threads
+           serving sampled requests every PROFILE_INTERVAL_MS (via
+           sys._current_frames(); nothing is installed in the request thread,
+           so an unsampled request pays one random() call)
+    alloc  for endpoints listed in PROFILE_ALLOC_ROUTES, tracemalloc runs for
+           the duration of a sampled request; the allocations still live at
+           the end (plus the peak) are recorded. tracemalloc is process-wide
+           and slows everything down while on, so at most one request per
+           process is traced at a time; concurrent requests' allocations
+           land in the same snapshot.
+
+Stacks are aggregated per route ("POST /api/verify-payment") in collapsed
+"frame;frame;frame count" form, ready for flamegraph.pl or speedscope. The
+number of distinct stacks per route is capped, so memory stays bounded no
+matter how long it is left on. Data is per process (pid is in the summary).
+"""
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+
+from flask import g, request
+
+OTHER_STACK = '[other]'
+
+
+def frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)})"
+
+
+def fold_frame(frame, max_depth):
+    labels = []
+    while frame is not None and len(labels) < max_depth:
+        labels.append(frame_label(frame.f_code))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+
+def fold_traceback(traceback):
+    # tracemalloc tracebacks are already oldest frame first
+    return ';'.join(f"{os.path.basename(f.filename)}:{f.lineno}" for f in traceback)
+
+
+class RouteProfile:
+    def __init__(self):
+        self.requests = 0
+        self.samples = 0
+        self.wall_seconds = 0.0
+        self.cpu_stacks = Counter()
+        self.alloc_requests = 0
+        self.alloc_peak = 0
+        self.alloc_stacks = Counter()  # Folded traceback -> bytes still allocated at request end
+
+    def summary(self, top=10):
+        leaf = Counter()
+        for stack, count in self.cpu_stacks.items():
+            leaf[stack.rsplit(';', 1)[-1]] += count
+        return {
+            'sampled_requests': self.requests,
+            'samples': self.samples,
+            'avg_ms': round(self.wall_seconds / self.requests * 1000, 2) if self.requests else None,
+            'distinct_stacks': len(self.cpu_stacks),
+            'top_functions': [{'function': f, 'samples': c} for f, c in leaf.most_common(top)],
+            'alloc_requests': self.alloc_requests,
+            'alloc_peak_bytes': self.alloc_peak,
+            'top_allocations': [{'stack': s.rsplit(';', 1)[-1], 'bytes': b} for s, b in self.alloc_stacks.most_common(top)],
+        }
+
+
+class Profiler:
+    def __init__(self, sample_rate=0.0, interval=0.005, alloc_routes=(), max_depth=64,
+                 max_stacks=5000, alloc_frames=16, alloc_top=50):
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.alloc_routes = set(alloc_routes)
+        self.max_depth = max_depth
+        self.max_stacks = max_stacks
+        self.alloc_frames = alloc_frames
+        self.alloc_top = alloc_top
+        self.routes = defaultdict(RouteProfile)
+        self._active = {}  # Thread ident -> route, for requests being sampled
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._alloc_lock = threading.Lock()
+
+    def init_app(self, app):
+        self.sample_rate = float(app.config.get('PROFILE_SAMPLE_RATE', self.sample_rate))
+        self.interval = float(app.config.get('PROFILE_INTERVAL_MS', self.interval * 1000)) / 1000
+        self.alloc_routes = set(app.config.get('PROFILE_ALLOC_ROUTES', self.alloc_routes))
+        app.extensions['profiler'] = self
+        app.before_request(self._before_request)
+        app.teardown_request(self._teardown_request)
+        if self.sample_rate:
+            print(f"Profiling {self.sample_rate:.2%} of requests (alloc routes: {', '.join(sorted(self.alloc_routes)) or 'none'})")
+
+    # --------------------------------------------------------------------------
+    # Request hooks
+    # --------------------------------------------------------------------------
+    def _before_request(self):
+        if not self.sample_rate or random.random() >= self.sample_rate:
+            return
+        rule = request.url_rule.rule if request.url_rule else '<unmatched>'
+        route = f"{request.method} {rule}"
+        g._profile = {'route': route, 'started': time.perf_counter(), 'alloc': False}
+        if request.endpoint in self.alloc_routes:
+            g._profile['alloc'] = self._start_alloc()
+        self._track(route)
+
+    def _teardown_request(self, exc=None):
+        state = g.pop('_profile', None)
+        if state is None:
+            return
+        self._untrack()
+        elapsed = time.perf_counter() - state['started']
+        snapshot = peak = None
+        if state['alloc']:
+            snapshot, peak = self._finish_alloc()
+        with self._lock:
+            profile = self.routes[state['route']]
+            profile.requests += 1
+            profile.wall_seconds += elapsed
+            if snapshot is not None:
+                profile.alloc_requests += 1
+                profile.alloc_peak = max(profile.alloc_peak, peak)
+                for stat in snapshot.statistics('traceback')[:self.alloc_top]:
+                    self._add(profile.alloc_stacks, fold_traceback(stat.traceback), stat.size)
+
+    # --------------------------------------------------------------------------
+    # CPU sampling
+    # --------------------------------------------------------------------------
+    def _track(self, route):
+        with self._lock:
+            self._active[threading.get_ident()] = route
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='profiler-sampler', daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def _untrack(self):
+        with self._lock:
+            self._active.pop(threading.get_ident(), None)
+
+    def _run(self):
+        while True:
+            if not self._active:
+                # Idle until a sampled request starts
+                self._wake.wait()
+                self._wake.clear()
+                continue
+            self.sample()
+            time.sleep(self.interval)
+
+    def sample(self):
+        frames = sys._current_frames()
+        with self._lock:
+            for ident, route in self._active.items():
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                profile = self.routes[route]
+                profile.samples += 1
+                self._add(profile.cpu_stacks, fold_frame(frame, self.max_depth), 1)
+
+    def _add(self, counter, stack, amount):
+        if stack not in counter and len(counter) >= self.max_stacks:
+            stack = OTHER_STACK
+        counter[stack] += amount
+
+    # --------------------------------------------------------------------------
+    # Allocation snapshots
+    # --------------------------------------------------------------------------
+    def _start_alloc(self):
+        if not self._alloc_lock.acquire(blocking=False):
+            return False  # Another request is being traced
+        if tracemalloc.is_tracing():
+            self._alloc_lock.release()  # Started outside us (e.g. PYTHONTRACEMALLOC); leave it alone
+            return False
+        tracemalloc.start(self.alloc_frames)
+        return True
+
+    def _finish_alloc(self):
+        try:
+            snapshot = tracemalloc.take_snapshot()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+            self._alloc_lock.release()
+        snapshot = snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__),
+                                           tracemalloc.Filter(False, __file__)])
+        return snapshot, peak
+
+    # --------------------------------------------------------------------------
+    # Reporting
+    # --------------------------------------------------------------------------
+    def summary(self):
+        with self._lock:
+            routes = {route: p.summary() for route, p in sorted(self.routes.items())}
+        return {
+            'pid': os.getpid(),
+            'sample_rate': self.sample_rate,
+            'interval_ms': self.interval * 1000,
+            'alloc_routes': sorted(self.alloc_routes),
+            'routes': routes,
+        }
+
+    def collapsed(self, kind='cpu', route=None):
+        """Collapsed stacks for flamegraph.pl/speedscope; with no route, the route is the root frame."""
+        lines = []
+        with self._lock:
+            for name, profile in sorted(self.routes.items()):
+                if route and name != route:
+                    continue
+                stacks = profile.cpu_stacks if kind == 'cpu' else profile.alloc_stacks
+                prefix = '' if route else f"{name};"
+                lines.extend(f"{prefix}{stack} {count}" for stack, count in stacks.most_common())
+        return '\n'.join(lines) + '\n' if lines else ''
+
+    def reset(self):
+        with self._lock:
+            self.routes.clear()
+
+
+profiler = Profiler()
@@ -431,6 +431,13 @@ class RealAuthService {
     }
 
     async checkSession() {
+        // First check uses the state embedded in the page by the server
+        const embedded = window.__AUTH_STATE__;
+        if (embedded) {
+            window.__AUTH_STATE__ = null;
+            this.currentUser = embedded.authenticated ? embedded.user : null;
+            return this.currentUser;
+        }
         try {
             const res = await fetch('/api/user');
             const data = await res.json();
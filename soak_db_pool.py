@@ -0,0 +1,100 @@
+"""
+Pool soak test: hammer a local Postgres, kill it mid-run, bring it back and
+check that the pool recovers on its own under the chosen liveness mode.
+
+    python soak_db_pool.py --url postgresql://localhost/jeeto_soak --liveness idle \\
+        --kill-cmd "pg_ctl -D /tmp/pgdata stop -m immediate" \\
+        --start-cmd "pg_ctl -D /tmp/pgdata start -w"
+
+Prints per-second ok/error counts, how long after the restart queries started
+succeeding again, and the final pool metrics. Exits non-zero if the pool never
+recovered or kept failing after recovery.
+"""
+import argparse
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+
+from sqlalchemy import create_engine, text
+
+import db_pool
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url', required=True)
+    parser.add_argument('--liveness', choices=db_pool.LIVENESS_MODES, default='idle')
+    parser.add_argument('--threads', type=int, default=20)
+    parser.add_argument('--duration', type=float, default=60)
+    parser.add_argument('--outage', type=float, default=5, help="Seconds the database stays down")
+    parser.add_argument('--kill-cmd', required=True)
+    parser.add_argument('--start-cmd', required=True)
+    parser.add_argument('--pool-size', type=int, default=5)
+    parser.add_argument('--pool-timeout', type=float, default=5)
+    args = parser.parse_args(argv)
+
+    engine = create_engine(args.url, **db_pool.engine_options(args.liveness, {
+        'poolclass': db_pool.InstrumentedQueuePool,
+        'pool_size': args.pool_size,
+        'max_overflow': args.pool_size,
+        'pool_timeout': args.pool_timeout,
+        'pool_recycle': 300,
+    }))
+    db_pool.instrument_engine(engine, 'soak', args.liveness, idle_ping_seconds=1)
+
+    started = time.monotonic()
+    stop = threading.Event()
+    per_second = defaultdict(lambda: [0, 0])  # second -> [ok, errors]
+    restarted_at = {}
+    lock = threading.Lock()
+
+    def worker():
+        while not stop.is_set():
+            second = int(time.monotonic() - started)
+            try:
+                with engine.connect() as conn:
+                    conn.execute(text('SELECT 1'))
+                ok = True
+            except Exception:
+                ok = False
+                time.sleep(0.05)
+            with lock:
+                per_second[second][0 if ok else 1] += 1
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(args.threads)]
+    for t in threads:
+        t.start()
+
+    time.sleep(args.duration / 2)
+    print(f"[{time.monotonic() - started:.1f}s] killing database: {args.kill_cmd}")
+    subprocess.run(args.kill_cmd, shell=True, check=False)
+    time.sleep(args.outage)
+    print(f"[{time.monotonic() - started:.1f}s] starting database: {args.start_cmd}")
+    subprocess.run(args.start_cmd, shell=True, check=False)
+    restarted_at['t'] = time.monotonic() - started
+
+    time.sleep(max(0, args.duration - (time.monotonic() - started)))
+    stop.set()
+    for t in threads:
+        t.join()
+
+    print("\nsecond   ok  errors")
+    for second in sorted(per_second):
+        ok, errors = per_second[second]
+        print(f"{second:6d} {ok:4d} {errors:7d}")
+
+    restart_second = int(restarted_at['t'])
+    recovered = next((s for s in sorted(per_second) if s >= restart_second and per_second[s][0]), None)
+    if recovered is None:
+        print("\nFAIL: pool never recovered after the restart")
+        return 1
+    late_errors = sum(per_second[s][1] for s in per_second if s > recovered + 1)
+    print(f"\nRecovered {recovered - restarted_at['t']:.1f}s after restart; errors after recovery: {late_errors}")
+    print(db_pool.snapshot()['pools']['soak'])
+    return 1 if late_errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,115 @@
+"""
+Post-payment job handlers, run by worker.py.
+
+Every handler takes the job payload ({'payment_id': ...}) and must be safe to
+run more than once, since a job is retried if the worker dies mid-run.
+Housekeeping jobs are enqueued periodically by the worker itself.
+"""
+import datetime
+import os
+import smtplib
+from email.message import EmailMessage
+
+from app import db, ChangeEvent, LedgerEntry, Payment, job_queue, refresh_purchase_rollup, save_order, whatsapp_link_for
+
+SMTP_HOST = os.getenv('SMTP_HOST')
+SMTP_PORT = int(os.getenv('SMTP_PORT', '587'))
+SMTP_USER = os.getenv('SMTP_USER')
+SMTP_PASSWORD = os.getenv('SMTP_PASSWORD')
+MAIL_FROM = os.getenv('MAIL_FROM', SMTP_USER or 'no-reply@jeetojee.in')
+CHANGE_EVENT_RETENTION_HOURS = float(os.getenv('CHANGE_EVENT_RETENTION_HOURS', '24'))
+
+
+def send_email(to, subject, body):
+    if not SMTP_HOST:
+        print(f"SMTP not configured, skipping email to {to}: {subject}")
+        return
+    msg = EmailMessage()
+    msg['From'] = MAIL_FROM
+    msg['To'] = to
+    msg['Subject'] = subject
+    msg.set_content(body)
+    with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=30) as smtp:
+        smtp.starttls()
+        if SMTP_USER:
+            smtp.login(SMTP_USER, SMTP_PASSWORD)
+        smtp.send_message(msg)
+
+
+def _payment(payload):
+    payment = db.session.get(Payment, payload['payment_id'])
+    if not payment:
+        # Deleted from the admin dashboard before the job ran; nothing left to do
+        print(f"Payment {payload['payment_id']} no longer exists, skipping job")
+    return payment
+
+
+@job_queue.handler('send_receipt')
+def send_receipt(payload):
+    payment = _payment(payload)
+    if not payment or not payment.student_email:
+        return
+    send_email(
+        payment.student_email,
+        f"JEETO JEE receipt - {payment.custom_id}",
+        f"Hi {payment.student_name or 'there'},\n\n"
+        f"Thank you for joining JEETO JEE. Here is your receipt.\n\n"
+        f"Order ID: {payment.custom_id}\n"
+        f"Plan: {payment.plan_name}\n"
+        f"Amount: {payment.currency} {payment.amount:.2f}\n"
+        f"Payment ID: {payment.razorpay_payment_id or '-'}\n"
+        f"Date: {payment.timestamp:%Y-%m-%d %H:%M} UTC\n"
+    )
+
+
+@job_queue.handler('send_community_invite')
+def send_community_invite(payload):
+    payment = _payment(payload)
+    if not payment or not payment.student_email:
+        return
+    link = whatsapp_link_for(payment)
+    if not link:
+        return
+    send_email(
+        payment.student_email,
+        "Your JEETO JEE community invite",
+        f"Hi {payment.student_name or 'there'},\n\n"
+        f"Join the exclusive WhatsApp community for {payment.plan_name}:\n{link}\n"
+    )
+
+
+@job_queue.handler('append_order_ledger')
+def append_order_ledger(payload):
+    payment = _payment(payload)
+    if not payment:
+        return
+    transaction_id = payment.razorpay_payment_id or payment.custom_id
+    if LedgerEntry.query.filter_by(transaction_id=transaction_id).first():
+        return  # Appended by an earlier run of this job
+    # Committed with the job; a concurrent duplicate fails on the unique id here, before writing
+    db.session.add(LedgerEntry(transaction_id=transaction_id))
+    db.session.flush()
+    student = {'name': payment.student_name, 'email': payment.student_email, 'phone': payment.student_phone}
+    plan = {'name': payment.plan_name, 'category': payment.plan_category}
+    save_order(student, plan, transaction_id, status=payment.status, amount=payment.amount)
+
+
+@job_queue.handler('update_rollup')
+def update_rollup(payload):
+    payment = _payment(payload)
+    if not payment or not payment.student_email:
+        return
+    # Recomputed from scratch so retries and out-of-order jobs converge
+    refresh_purchase_rollup(payment.student_email)
+
+
+@job_queue.handler('prune_change_events')
+def prune_change_events(payload):
+    # Dashboards further behind than this get a resync event from /admin/stream and reload
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(hours=CHANGE_EVENT_RETENTION_HOURS)
+    deleted = ChangeEvent.query.filter(ChangeEvent.created_at < cutoff).delete(synchronize_session=False)
+    if deleted:
+        print(f"Pruned {deleted} change events older than {CHANGE_EVENT_RETENTION_HOURS}h")
+
+
+job_queue.every(3600, 'prune_change_events')
@@ -0,0 +1,140 @@
+import json
+
+from conftest import admin_client  # Isolated DB + test keys; must come before importing the app
+
+from sqlalchemy import func
+
+from app import app, db, ChangeEvent, Payment, User
+
+app.config['ADMIN_STREAM_MAX_SECONDS'] = 0.5
+app.config['ADMIN_STREAM_SETTLE_SECONDS'] = 0
+
+
+def read_events(client, cursor=None, last_event_id=None):
+    headers = {'Last-Event-ID': str(last_event_id)} if last_event_id is not None else {}
+    url = '/admin/stream' + (f'?cursor={cursor}' if cursor is not None else '')
+    body = client.get(url, headers=headers).get_data(as_text=True)
+    events = []
+    for block in body.split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.splitlines() if ': ' in line and not line.startswith(':'))
+        if 'event' in fields:
+            events.append(fields)
+    return events
+
+
+def read_changes(client, cursor=None, last_event_id=None):
+    return [(int(e['id']), json.loads(e['data'])) for e in read_events(client, cursor, last_event_id)
+            if e['event'] == 'changes']
+
+
+def current_cursor():
+    with app.app_context():
+        return db.session.query(func.max(ChangeEvent.id)).scalar() or 0
+
+
+def test_stream_requires_admin():
+    assert app.test_client().get('/admin/stream').status_code == 401
+
+
+def test_payment_transition_is_streamed_as_delta():
+    cursor = current_cursor()
+    with app.app_context():
+        # Checkout placeholder: not on the dashboard, so no event
+        payment = Payment(custom_id='#SSE001', status='INIT')
+        db.session.add(payment)
+        db.session.commit()
+        assert current_cursor() == cursor
+
+        payment.status = 'PAID'
+        payment.razorpay_payment_id = 'pay_sse_1'
+        payment.student_name = 'Stream Test'
+        db.session.commit()
+        payment_id = payment.id
+
+    messages = read_changes(admin_client(), cursor=cursor)
+    assert len(messages) == 1
+    event_id, delta = messages[0]
+    assert [p['id'] for p in delta['payments']] == [payment_id]
+    assert delta['payments'][0]['visible'] and delta['payments'][0]['status'] == 'PAID'
+
+    # Reconnect with Last-Event-ID resumes after what was already delivered
+    assert read_changes(admin_client(), cursor=cursor, last_event_id=event_id) == []
+
+
+def test_user_delete_and_bulk_reset():
+    cursor = current_cursor()
+    with app.app_context():
+        user = User(name='Live', email='live@test.com', phone='9222222222')
+        user.set_password('x')
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+
+    client = admin_client()
+    assert client.post(f'/admin/delete/user/{user_id}').get_json() == {'success': True}
+    with app.app_context():
+        # What /admin/delete-all/order records, without wiping the payments other tests share
+        db.session.add(ChangeEvent(entity='payment', op='reset'))
+        db.session.commit()
+
+    (_, delta), = read_changes(client, cursor=cursor)
+    # Created then deleted within one batch collapses to a delete
+    assert delta['users'] == [] and delta['deleted']['user'] == [user_id]
+    assert delta['reset'] == ['payment']
+
+
+def test_hidden_payment_updates_are_not_recorded():
+    with app.app_context():
+        payment = Payment(custom_id='#SSE002', status='INIT')
+        db.session.add(payment)
+        db.session.commit()
+        cursor = current_cursor()
+        payment.status = 'CREATED'
+        payment.razorpay_order_id = 'order_sse_2'
+        db.session.commit()
+        db.session.delete(payment)
+        db.session.commit()
+        assert current_cursor() == cursor
+
+
+def test_unsettled_events_are_held_back():
+    cursor = current_cursor()
+    with app.app_context():
+        user = User(name='Fresh', email='fresh@test.com', phone='9222222223')
+        user.set_password('x')
+        db.session.add(user)
+        db.session.commit()
+
+    app.config['ADMIN_STREAM_SETTLE_SECONDS'] = 60
+    try:
+        assert read_changes(admin_client(), cursor=cursor) == []
+    finally:
+        app.config['ADMIN_STREAM_SETTLE_SECONDS'] = 0
+    assert len(read_changes(admin_client(), cursor=cursor)) == 1
+
+
+def test_pruned_cursor_gets_resync_event():
+    with app.app_context():
+        db.session.add(ChangeEvent(entity='user', entity_id=1, op='upsert'))
+        db.session.commit()
+        cursor = current_cursor()
+        # Feed pruned past the client's cursor (like the retention job: only rows older than this
+        # test's own events go, and every other test reads from its own, newer cursor)
+        for _ in range(2):
+            db.session.add(ChangeEvent(entity='user', entity_id=1, op='upsert'))
+        db.session.commit()
+        ChangeEvent.query.filter(ChangeEvent.id <= cursor + 1).delete()
+        db.session.commit()
+
+    events = read_events(admin_client(), cursor=cursor)
+    assert [e['event'] for e in events] == ['resync']
+
+
+if __name__ == "__main__":
+    test_stream_requires_admin()
+    test_payment_transition_is_streamed_as_delta()
+    test_user_delete_and_bulk_reset()
+    test_hidden_payment_updates_are_not_recorded()
+    test_unsettled_events_are_held_back()
+    test_pruned_cursor_gets_resync_event()
+    print("SUCCESS: Admin stream works!")
@@ -0,0 +1,123 @@
+import threading
+import time
+
+import conftest  # noqa: F401  (isolated DB + test keys; must come before importing the app)
+
+from cache import LocalBackend, PassThroughCache, TwoTierCache, make_cache
+import app as app_module
+from app import app, db, Payment, User, active_plan_for_phone, load_user
+
+
+def two_workers():
+    shared = LocalBackend()
+    return TwoTierCache(shared), TwoTierCache(shared)
+
+
+def test_invalidation_reaches_other_workers():
+    a, b = two_workers()
+    a.set('user', 1, {'name': 'Old'})
+    assert b.get('user', 1) == {'name': 'Old'}  # Shared hit, now in b's local tier too
+
+    a.invalidate('user', 1)
+    assert b.get('user', 1) is None
+    assert b.stats()['namespaces']['user'] == {
+        'local_hits': 0, 'shared_hits': 1, 'misses': 1, 'sets': 0, 'invalidations': 0, 'errors': 0, 'hit_ratio': 0.5
+    }
+
+
+def test_namespace_invalidation_and_local_hits():
+    a, b = two_workers()
+    for i in range(3):
+        b.set('entitlement', f'phone:{i}', {'plan': i})
+    assert b.get('entitlement', 'phone:1') == {'plan': 1}
+    assert b.stats()['namespaces']['entitlement']['local_hits'] == 1
+
+    a.invalidate_namespace('entitlement')
+    assert [b.get('entitlement', f'phone:{i}') for i in range(3)] == [None, None, None]
+
+
+def test_stale_load_does_not_overwrite_invalidation():
+    a, b = two_workers()
+    loaded, invalidated = threading.Event(), threading.Event()
+
+    def stale_loader():
+        loaded.set()
+        invalidated.wait()  # The write commits and invalidates while this row is in flight
+        return {'name': 'Old'}
+
+    reader = threading.Thread(target=lambda: a.get_or_set('user', 1, stale_loader))
+    reader.start()
+    loaded.wait()
+    b.invalidate('user', 1)
+    invalidated.set()
+    reader.join()
+
+    assert a.get('user', 1) is None and b.get('user', 1) is None
+    assert b.get_or_set('user', 1, lambda: {'name': 'New'}) == {'name': 'New'}  # Not cached during the tombstone
+
+    a.tombstone_ttl = b.tombstone_ttl = 0.05
+    a.invalidate('user', 1)
+    time.sleep(0.1)
+    assert b.get_or_set('user', 1, lambda: {'name': 'New'}) == {'name': 'New'}
+    assert a.get('user', 1) == {'name': 'New'}
+
+
+def test_backend_outage_degrades_to_misses():
+    class DownBackend(LocalBackend):
+        def get(self, key):
+            raise ConnectionError('redis down')
+
+    c = TwoTierCache(DownBackend())
+    assert c.get_or_set('user', 7, lambda: {'id': 7}) == {'id': 7}
+    assert c.stats()['namespaces']['user']['errors'] >= 1
+
+
+def test_no_shared_backend_means_no_caching():
+    c = make_cache()
+    assert isinstance(c, PassThroughCache)
+    calls = []
+    for _ in range(2):
+        c.get_or_set('user', 1, lambda: calls.append(1) or {'id': 1})
+    assert len(calls) == 2
+    assert isinstance(make_cache(local_only=True), TwoTierCache)
+
+
+def test_payment_commit_invalidates_entitlement_and_user_cache():
+    # Exercise the app's hooks against a real two-tier cache
+    original, app_module.cache = app_module.cache, TwoTierCache(LocalBackend())
+    cache = app_module.cache
+    try:
+        _payment_commit_invalidates(cache)
+    finally:
+        app_module.cache = original
+
+
+def _payment_commit_invalidates(cache):
+    with app.app_context():
+        user = User(name='Cache Test', email='cache@test.com', phone='9333333333')
+        user.set_password('x')
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+
+        assert active_plan_for_phone('9333333333') is None  # Cached "no plan"
+        assert load_user(user_id).name == 'Cache Test'
+
+        db.session.add(Payment(custom_id='#CACHE001', status='PAID', student_phone='9333333333',
+                               plan_name='Elite Plan', plan_category='april', razorpay_payment_id='pay_cache_1'))
+        user.name = 'Renamed'
+        db.session.commit()
+
+        assert active_plan_for_phone('9333333333')['custom_id'] == '#CACHE001'
+        assert load_user(user_id).name == 'Renamed'
+        assert cache.stats()['namespaces']['entitlement']['invalidations'] >= 1
+
+
+if __name__ == "__main__":
+    test_invalidation_reaches_other_workers()
+    test_stale_load_does_not_overwrite_invalidation()
+    test_namespace_invalidation_and_local_hits()
+    test_backend_outage_degrades_to_misses()
+    test_no_shared_backend_means_no_caching()
+    test_payment_commit_invalidates_entitlement_and_user_cache()
+    print("SUCCESS: Cache works!")
@@ -0,0 +1,70 @@
+import json
+import re
+
+import conftest  # noqa: F401  (isolated DB + test keys; must come before importing the app)
+
+from critical_css import extract_critical_css
+from app import app, db, User
+
+CSS = """
+:root { --c: red; }
+/* comment { } */
+body { margin: 0; }
+.hero { color: var(--c); animation: fadeIn 1s; }
+.hero .cta:hover { color: blue; }
+.pricing-card { padding: 2rem; }
+#mentors h2 { font-size: 2rem; }
+@media (max-width: 600px) { .hero { padding: 0; } .pricing-card { padding: 0; } }
+@media print { .pricing-card { display: none; } }
+@keyframes fadeIn { from { opacity: 0; } to { opacity: 1; } }
+@keyframes unused { from { opacity: 0; } }
+@font-face { font-family: X; src: url(x.woff2); }
+"""
+
+HTML = """<body><section class="hero"><a class="cta">Go</a></section>
+<!-- Meet Your Mentors -->
+<section id="mentors"><h2>Mentors</h2></section><div class="pricing-card"></div></body>"""
+
+
+def test_extracts_above_the_fold_rules_only():
+    css = extract_critical_css(CSS, HTML)
+    assert ':root{--c:red}' in css and 'body{margin:0}' in css
+    assert '.hero .cta:hover{color:blue}' in css
+    assert '@media (max-width:600px){.hero{padding:0}}' in css
+    assert '@keyframes fadeIn' in css and 'unused' not in css
+    assert '@font-face' in css
+    assert 'pricing-card' not in css and '#mentors' not in css and '@media print' not in css
+
+
+def test_landing_page_inlines_css_and_sends_link_hints():
+    response = app.test_client().get('/')
+    html = response.get_data(as_text=True)
+    assert '</styles.css>; rel=preload; as=style' in response.headers['Link']
+    assert '<style id="critical-css">' in html
+    assert 'rel="preload" href="styles.css"' in html
+    assert json.loads(re.search(r'window.__AUTH_STATE__ = (.*?);</script>', html).group(1)) == {'authenticated': False}
+
+    # A/B switch falls back to the render-blocking stylesheet
+    html = app.test_client().get('/?critical=0').get_data(as_text=True)
+    assert 'critical-css' not in html and '<link rel="stylesheet" href="styles.css">' in html
+
+
+def test_auth_state_embedded_for_logged_in_user():
+    with app.app_context():
+        user = User(name='Hint Test', email='hint@test.com', phone='9444444444')
+        user.set_password('secret')
+        db.session.add(user)
+        db.session.commit()
+
+    client = app.test_client()
+    assert client.post('/api/login', json={'identifier': 'hint@test.com', 'password': 'secret'}).status_code == 200
+    html = client.get('/').get_data(as_text=True)
+    state = json.loads(re.search(r'window.__AUTH_STATE__ = (.*?);</script>', html).group(1))
+    assert state['authenticated'] and state['user']['email'] == 'hint@test.com'
+
+
+if __name__ == "__main__":
+    test_extracts_above_the_fold_rules_only()
+    test_landing_page_inlines_css_and_sends_link_hints()
+    test_auth_state_embedded_for_logged_in_user()
+    print("SUCCESS: Critical CSS and Early Hints work!")
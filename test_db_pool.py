@@ -0,0 +1,71 @@
+import os
+import tempfile
+import threading
+import time
+
+from sqlalchemy import create_engine, exc, text
+
+import db_pool
+
+tmp_dir = tempfile.mkdtemp()
+
+
+def make_engine(name, liveness='pre_ping', idle_ping_seconds=30, **options):
+    options = db_pool.engine_options(liveness, dict({'poolclass': db_pool.InstrumentedQueuePool}, **options))
+    engine = create_engine(f"sqlite:///{os.path.join(tmp_dir, name + '.db')}", **options)
+    db_pool.instrument_engine(engine, name, liveness, idle_ping_seconds)
+    return engine
+
+
+def test_waits_and_timeouts_are_counted():
+    engine = make_engine('saturated', pool_size=1, max_overflow=0, pool_timeout=0.2)
+    held = engine.connect()
+
+    # Second checkout waits, then times out
+    try:
+        engine.connect()
+        assert False, "expected pool timeout"
+    except exc.TimeoutError:
+        pass
+
+    # Third checkout waits until the holder gives the connection back
+    threading.Timer(0.1, held.close).start()
+    with engine.connect() as conn:
+        conn.execute(text('SELECT 1'))
+
+    stats = db_pool.snapshot()['pools']['saturated']
+    assert stats['timeouts'] == 1
+    assert stats['checkouts'] == 2
+    assert stats['wait_seconds_max'] >= 0.05
+    assert stats['checked_out'] == 0 and stats['size'] == 1
+    assert 'db_pool_timeouts_total{pool="saturated"' in db_pool.prometheus_text()
+
+
+def test_idle_mode_only_pings_connections_past_threshold():
+    engine = make_engine('idle', liveness='idle', idle_ping_seconds=0.2, pool_size=1, max_overflow=0)
+    for _ in range(5):
+        with engine.connect() as conn:
+            conn.execute(text('SELECT 1'))
+    assert db_pool.snapshot()['pools']['idle']['pings'] == 0  # Back-to-back checkouts skip the ping
+
+    time.sleep(0.3)
+    with engine.connect() as conn:
+        conn.execute(text('SELECT 1'))
+    assert db_pool.snapshot()['pools']['idle']['pings'] == 1
+
+
+def test_counters_survive_dispose():
+    engine = make_engine('disposed')
+    with engine.connect():
+        pass
+    engine.dispose()
+    with engine.connect():
+        pass
+    assert db_pool.snapshot()['pools']['disposed']['checkouts'] == 2
+
+
+if __name__ == "__main__":
+    test_waits_and_timeouts_are_counted()
+    test_idle_mode_only_pings_connections_past_threshold()
+    test_counters_survive_dispose()
+    print("SUCCESS: Pool metrics work!")
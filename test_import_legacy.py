@@ -0,0 +1,96 @@
+import csv
+import os
+import tempfile
+
+import conftest  # noqa: F401  (isolated DB + test keys; must come before importing the app)
+
+import import_legacy
+from app import app, db, Lead, Payment
+from import_legacy import LEAD_COLUMNS, ORDER_COLUMNS, make_synthetic, run_import, state_path
+
+tmp_dir = tempfile.mkdtemp()
+import_legacy.IMPORT_STATE_DIR = os.path.join(tmp_dir, 'state')
+
+
+def test_orders_import_is_idempotent_and_resumable():
+    path = os.path.join(tmp_dir, 'orders.csv')
+    make_synthetic('orders', path, 2500)
+
+    # Pretend an earlier run committed the first 1000 rows before dying
+    first = run_import('orders', path, batch_size=1000, quiet=True)
+    assert first['read'] == 2500
+    with open(state_path(path, '.checkpoint'), 'w') as f:
+        f.write('{"source": "%s", "rows_done": 1000}' % os.path.abspath(path))
+    resumed = run_import('orders', path, batch_size=1000, quiet=True)
+    assert resumed['skipped'] == 1000 and resumed['read'] == 1500
+
+    with app.app_context():
+        imported = Payment.query.filter(Payment.razorpay_payment_id.like('pay_synth%'))
+        assert imported.count() == 2500
+        assert imported.filter(Payment.student_phone == '9000000007').one().student_email == 'student7@example.com'
+
+
+def test_leads_upsert_by_phone_and_rejects_bad_rows():
+    path = os.path.join(tmp_dir, 'leads.csv')
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(LEAD_COLUMNS)
+        writer.writerow(['2026-01-25 14:06:51', 'Old Name', '+91 98765 43210', '11th', ''])
+        writer.writerow(['2026-01-26 10:00:00', 'New Name', '9876543210', '12th', 'call me'])
+        writer.writerow(['2026-01-25 14:06:51', 'aabcd', '10928', 'Dropper', ''])
+        writer.writerow(['not a date', 'Bad', '9123456789', '12th', ''])
+
+    stats = run_import('leads', path, quiet=True)
+    assert stats['rejected'] == 2
+    with app.app_context():
+        lead = Lead.query.filter_by(phone='9876543210').one()
+        assert (lead.name, lead.class_grade) == ('New Name', '12th')
+    with open(state_path(path, '.rejects.csv')) as f:
+        assert len(f.readlines()) == 2
+    assert not os.path.exists(path + '.rejects.csv')  # Never next to the source
+
+
+def test_existing_order_ids_are_not_duplicated():
+    path = os.path.join(tmp_dir, 'orders_real.csv')
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(ORDER_COLUMNS)
+        row = ['2026-01-27 20:29:07', 'Test User', 'A@Gmail.com ', '1234567890', 'Elite Plan', 'april-boards', '699', 'PAID', '#aJEETOeJEEb900']
+        writer.writerow(row)
+        writer.writerow(row)
+
+    run_import('orders', path, quiet=True)
+    os.remove(state_path(path, '.checkpoint'))
+    run_import('orders', path, quiet=True)
+    with app.app_context():
+        payment = Payment.query.filter_by(custom_id='#aJEETOeJEEb900').one()
+        assert payment.student_email == 'A@Gmail.com'  # Case kept, so the account's exact-match entitlement queries see it
+
+
+def test_ledger_rows_for_existing_payments_are_skipped():
+    with app.app_context():
+        db.session.add(Payment(custom_id='#P2', status='PAID', razorpay_payment_id='pay_ledger_2',
+                               student_email='ledger@test.com'))
+        db.session.commit()
+
+    # Rows as append_order_ledger writes them: live payment id (twice, as after a retry) and a new one
+    path = os.path.join(tmp_dir, 'ledger.csv')
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(ORDER_COLUMNS)
+        writer.writerow(['2026-02-01 10:00:00', 'Ledger', 'ledger@test.com', '9000000002', 'Elite Plan', 'april', '699', 'PAID', 'pay_ledger_2'])
+        writer.writerow(['2026-02-01 10:00:05', 'Ledger', 'ledger@test.com', '9000000002', 'Elite Plan', 'april', '699', 'PAID', 'pay_ledger_2'])
+        writer.writerow(['2026-02-02 10:00:00', 'Other', 'other@test.com', '9000000003', 'Elite Plan', 'april', '699', 'PAID', 'pay_ledger_3'])
+
+    run_import('orders', path, quiet=True)
+    with app.app_context():
+        assert [p.custom_id for p in Payment.query.filter_by(razorpay_payment_id='pay_ledger_2')] == ['#P2']
+        assert Payment.query.filter_by(razorpay_payment_id='pay_ledger_3').count() == 1
+
+
+if __name__ == "__main__":
+    test_orders_import_is_idempotent_and_resumable()
+    test_leads_upsert_by_phone_and_rejects_bad_rows()
+    test_existing_order_ids_are_not_duplicated()
+    test_ledger_rows_for_existing_payments_are_skipped()
+    print("SUCCESS: Legacy import works!")
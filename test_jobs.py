@@ -0,0 +1,129 @@
+import datetime
+import os
+import tempfile
+
+from conftest import admin_client  # Isolated DB + test keys; must come before importing the app
+
+from sqlalchemy import event
+
+import app as app_module
+from app import app, db, ChangeEvent, Job, Payment, PurchaseRollup, job_queue
+import tasks  # noqa: F401  (registers handlers)
+
+
+def test_verify_payment_enqueues_and_worker_fulfils():
+    with app.app_context():
+        db.session.add(Payment(custom_id='#JOB001', status='CREATED', razorpay_order_id='order_job_1',
+                               student_name='Job Test', student_email='job@test.com', student_phone='9111111111',
+                               plan_name='Elite Plan', plan_category='april', amount=699))
+        db.session.commit()
+
+    response = app.test_client().post('/api/verify-payment', json={
+        'razorpay_order_id': 'order_job_1', 'razorpay_payment_id': 'pay_mock_job_1', 'custom_id': '#JOB001'
+    })
+    assert response.get_json()['status'] == 'success'
+
+    # The rollup is already current for /success, before the worker has run
+    statements = []
+    with app.app_context():
+        assert PurchaseRollup.query.filter_by(student_email='job@test.com').one().paid_count == 1
+        listener = lambda conn, cursor, sql, *args: statements.append(sql)  # noqa: E731
+        event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        page = app.test_client().get('/success?order_id=%23JOB001').get_data(as_text=True)
+    finally:
+        with app.app_context():
+            event.remove(db.engine, 'before_cursor_execute', listener)
+    assert 'Welcome Aboard' in page
+    assert not [sql for sql in statements if 'count(' in sql.lower()]
+
+    original_ledger = app_module.ORDERS_LEDGER_PATH
+    ledger_path = os.path.join(tempfile.mkdtemp(), 'orders.csv')
+    app_module.ORDERS_LEDGER_PATH = ledger_path
+    try:
+        with app.app_context():
+            payment = Payment.query.filter_by(custom_id='#JOB001').one()
+            jobs = Job.query.filter(Job.dedupe_key.like(f'%:{payment.id}')).all()
+            assert sorted(j.kind for j in jobs) == sorted(['send_receipt', 'send_community_invite', 'append_order_ledger', 'update_rollup'])
+
+            job_queue.drain()
+            assert {j.state for j in Job.query.filter(Job.id.in_([j.id for j in jobs]))} == {'DONE'}
+            assert PurchaseRollup.query.filter_by(student_email='job@test.com').one().paid_count == 1
+            # A retried ledger job (e.g. after an expired lease) doesn't append again
+            tasks.append_order_ledger({'payment_id': payment.id})
+            db.session.commit()
+            with open(ledger_path) as f:
+                assert f.read().count('pay_mock_job_1') == 1
+    finally:
+        app_module.ORDERS_LEDGER_PATH = original_ledger
+
+    # The ledger and the legacy CSVs are never served
+    client = app.test_client()
+    assert client.get('/orders.csv').status_code == 404
+    assert client.get('/instance/orders.csv').status_code == 404
+
+
+def test_deleting_an_order_resets_its_purchase_rollup():
+    with app.app_context():
+        payment = Payment(custom_id='#ROLL001', status='PAID', razorpay_payment_id='pay_roll_1',
+                          student_email='roll@test.com', plan_name='Elite Plan')
+        db.session.add(payment)
+        db.session.commit()
+        tasks.update_rollup({'payment_id': payment.id})
+        db.session.commit()
+        payment_id = payment.id
+        assert PurchaseRollup.query.filter_by(student_email='roll@test.com').one().paid_count == 1
+
+    assert admin_client().post(f'/admin/delete/order/{payment_id}').get_json() == {'success': True}
+    with app.app_context():
+        assert PurchaseRollup.query.filter_by(student_email='roll@test.com').count() == 0
+
+
+def test_worker_prunes_old_change_events():
+    with app.app_context():
+        old = datetime.datetime.utcnow() - datetime.timedelta(hours=tasks.CHANGE_EVENT_RETENTION_HOURS + 1)
+        db.session.add(ChangeEvent(entity='user', entity_id=1, op='upsert', created_at=old))
+        db.session.add(ChangeEvent(entity='user', entity_id=2, op='upsert'))
+        db.session.commit()
+
+        job_queue.enqueue_periodic()
+        job_queue.enqueue_periodic()  # Same slot: not enqueued twice
+        assert Job.query.filter_by(kind='prune_change_events').count() == 1
+        job_queue.drain()
+        assert ChangeEvent.query.filter(ChangeEvent.created_at < old + datetime.timedelta(minutes=1)).count() == 0
+        assert ChangeEvent.query.filter_by(entity_id=2).count() >= 1
+
+
+def test_failing_job_backs_off_then_goes_dead():
+    attempts = []
+
+    @job_queue.handler('always_fails')
+    def always_fails(payload):
+        attempts.append(payload)
+        raise RuntimeError('smtp down')
+
+    with app.app_context():
+        job = job_queue.enqueue('always_fails', {'n': 1})
+        job.max_attempts = 3
+        db.session.commit()
+
+        for expected_attempt in range(1, 4):
+            assert job_queue.run_once()
+            job = db.session.get(Job, job.id)
+            assert job.attempts == expected_attempt
+            if job.state == 'QUEUED':
+                assert job.run_at > datetime.datetime.utcnow()  # Backed off
+                job.run_at = datetime.datetime.utcnow()  # Fast-forward for the test
+                db.session.commit()
+
+        assert job.state == 'DEAD' and 'smtp down' in job.last_error
+        assert len(attempts) == 3
+        assert not job_queue.run_once()
+
+
+if __name__ == "__main__":
+    test_verify_payment_enqueues_and_worker_fulfils()
+    test_deleting_an_order_resets_its_purchase_rollup()
+    test_worker_prunes_old_change_events()
+    test_failing_job_backs_off_then_goes_dead()
+    print("SUCCESS: Job queue works!")
@@ -0,0 +1,120 @@
+from conftest import admin_client  # Isolated DB + test keys; must come before importing the app
+
+import app as app_module
+from app import app, db, ChangeEvent, User
+from onboarding import make_synthetic, onboard_students, phone_key
+from sqlalchemy import func, or_, select, text
+
+
+def test_bulk_endpoint_reports_per_row_errors():
+    with app.app_context():
+        user = User(name='Existing', email='taken@partner.com', phone='9555555555')
+        user.set_password('x')
+        db.session.add(user)
+        db.session.commit()
+
+    csv_body = '\n'.join([
+        'Name,Email,Phone,Password',
+        'Asha,asha@partner.com,+91 95555 00001,secret1',
+        'Ravi,ravi@partner.com,9555500002,',
+        'Dup,ASHA@partner.com,9555500003,x',     # duplicate email in upload
+        'Taken,taken@partner.com,9555500004,x',  # already registered
+        'Phone,phone@partner.com,12345,x',       # invalid phone
+        ',noname@partner.com,9555500005,x',      # missing name
+    ])
+    assert app.test_client().post('/admin/api/students/bulk', data=csv_body,
+                                  content_type='text/csv').status_code == 401
+
+    report = admin_client().post('/admin/api/students/bulk', data=csv_body, content_type='text/csv').get_json()
+    assert (report['created'], report['failed']) == (2, 4)
+    assert [e['row'] for e in report['errors']] == [3, 4, 5, 6]
+    assert 'already registered' in report['errors'][1]['error']
+
+    asha, ravi = report['students']
+    assert asha['phone'] == '9555500001' and 'password' not in asha
+    assert ravi['password']  # Generated and returned once
+    client = app.test_client()
+    assert client.post('/api/login', json={'identifier': 'ravi@partner.com', 'password': ravi['password']}).status_code == 200
+
+    with app.app_context():
+        assert ChangeEvent.query.filter_by(entity='user', entity_id=asha['id']).count() == 1
+
+
+def test_conflicts_match_raw_phones_and_email_case():
+    with app.app_context():
+        # As /api/register stored them before phones were normalized
+        user = User(name='Legacy', email='Legacy@Partner.com', phone='+91 95555 00020')
+        user.set_password('x')
+        db.session.add(user)
+        db.session.commit()
+
+    payload = [{'name': 'Same Phone', 'email': 'new@partner.com', 'phone': '9555500020'},
+               {'name': 'Same Email', 'email': 'legacy@partner.com', 'phone': '9555500021'}]
+    report = admin_client().post('/admin/api/students/bulk', json=payload).get_json()
+    assert (report['created'], report['failed']) == (0, 2)
+
+    # /api/register applies the same rules and stores the normalized phone
+    client = app.test_client()
+    taken = client.post('/api/register', json={'name': 'X', 'email': 'LEGACY@partner.com',
+                                               'phone': '9555500022', 'password': 'x'})
+    assert taken.status_code == 400
+    ok = client.post('/api/register', json={'name': 'Y', 'email': 'y@partner.com',
+                                            'phone': '+91 95555-00023', 'password': 'pw'})
+    assert ok.get_json()['user']['phone'] == '9555500023'
+    assert app.test_client().post('/api/login', json={'identifier': '+91 95555 00023',
+                                                      'password': 'pw'}).status_code == 200
+
+
+def test_register_and_login_lookups_use_indexes():
+    with app.app_context():
+        conn = db.session.connection()
+        key = phone_key(User.phone, conn.dialect.name)
+        queries = [
+            select(User.id).where(or_(func.lower(User.email) == 'a@b.com', key == '9876543210')),  # /api/login
+            select(func.lower(User.email)).where(func.lower(User.email).in_(['a@b.com'])),       # /api/register
+            select(key).where(key.in_(['9876543210'])),
+        ]
+        for query in queries:
+            sql = str(query.compile(dialect=conn.dialect, compile_kwargs={'literal_binds': True}))
+            plan = ' | '.join(row[-1] for row in conn.execute(text('EXPLAIN QUERY PLAN ' + sql)))
+            assert 'SCAN' not in plan and 'USING INDEX ix_user_' in plan, plan
+
+
+def test_json_dry_run_inserts_nothing():
+    payload = {'students': [{'name': 'Dry', 'email': 'dry@partner.com', 'phone': '9555500010'}]}
+    report = admin_client().post('/admin/api/students/bulk?dry_run=1', json=payload).get_json()
+    assert (report['valid'], report['created']) == (1, 0)
+    with app.app_context():
+        assert User.query.filter_by(email='dry@partner.com').count() == 0
+
+
+def test_process_pool_and_rehash_on_login():
+    app_module.ONBOARDING_HASH_METHOD = 'scrypt:1024:8:1'
+    try:
+        with app.app_context():
+            records = make_synthetic(120, offset=500)
+            records[0]['password'] = 'known-password'
+            report = onboard_students(db, User, ChangeEvent, records, 'scrypt:1024:8:1', workers=2, chunk_size=50)
+            assert (report['created'], report['failed']) == (120, 0)
+            assert User.query.filter(User.email.like('bulk%@partner.example.com')).count() == 120
+
+            # Re-running is rejected row by row, nothing is duplicated
+            again = onboard_students(db, User, ChangeEvent, make_synthetic(120, offset=500), workers=1)
+            assert (again['created'], again['failed']) == (0, 120)
+
+        client = app.test_client()
+        email = records[0]['email']
+        assert client.post('/api/login', json={'identifier': email, 'password': 'known-password'}).status_code == 200
+        with app.app_context():
+            assert not User.query.filter_by(email=email).one().password_hash.startswith('scrypt:1024:8:1$')
+    finally:
+        app_module.ONBOARDING_HASH_METHOD = None
+
+
+if __name__ == "__main__":
+    test_bulk_endpoint_reports_per_row_errors()
+    test_conflicts_match_raw_phones_and_email_case()
+    test_register_and_login_lookups_use_indexes()
+    test_json_dry_run_inserts_nothing()
+    test_process_pool_and_rehash_on_login()
+    print("SUCCESS: Bulk onboarding works!")
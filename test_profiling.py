@@ -0,0 +1,78 @@
+import threading
+import time
+
+from conftest import admin_client  # Isolated DB + test keys; must come before importing the app
+
+from app import app, profiler
+from profiling import OTHER_STACK, Profiler
+
+
+def busy_checkout(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        sum(range(1000))
+
+
+def test_sampler_folds_stacks_of_tracked_threads():
+    p = Profiler()
+    ready, done = threading.Event(), threading.Event()
+
+    def request_thread():
+        p._track('POST /api/checkout')
+        ready.set()
+        busy_checkout(0.2)
+        p._untrack()
+        done.set()
+
+    threading.Thread(target=request_thread).start()
+    ready.wait()
+    for _ in range(5):
+        p.sample()
+    done.wait()
+
+    profile = p.routes['POST /api/checkout']
+    assert profile.samples >= 5  # The background sampler thread adds its own
+    folded = p.collapsed('cpu', 'POST /api/checkout')
+    assert 'request_thread (test_profiling.py);busy_checkout (test_profiling.py)' in folded
+    assert OTHER_STACK not in folded
+    assert sum(int(line.rsplit(' ', 1)[1]) for line in folded.splitlines()) == profile.samples
+
+
+def test_distinct_stacks_are_capped():
+    p = Profiler(max_stacks=2)
+    for stack in ('a;b', 'a;c', 'a;d', 'a;b'):
+        p._add(p.routes['GET /'].cpu_stacks, stack, 1)
+    assert dict(p.routes['GET /'].cpu_stacks) == {'a;b': 2, 'a;c': 1, OTHER_STACK: 1}
+
+
+def test_sampled_requests_are_aggregated_per_route():
+    profiler.reset()
+    profiler.sample_rate = 1.0
+    profiler.alloc_routes = {'get_current_user'}
+    try:
+        client = app.test_client()
+        for _ in range(3):
+            assert client.get('/api/user').status_code == 200
+    finally:
+        profiler.sample_rate = 0.0
+        profiler.alloc_routes = set()
+
+    assert app.test_client().get('/admin/profiling').status_code == 401
+    summary = admin_client().get('/admin/profiling').get_json()
+    route = summary['routes']['GET /api/user']
+    assert route['sampled_requests'] == 3
+    assert route['alloc_requests'] == 3 and route['alloc_peak_bytes'] > 0
+
+    response = admin_client().get('/admin/profiling/flamegraph?kind=alloc')
+    assert 'attachment' in response.headers['Content-Disposition']
+    assert all(line.startswith('GET /api/user;') for line in response.get_data(as_text=True).splitlines())
+
+    assert admin_client().post('/admin/profiling/reset').get_json() == {'success': True}
+    assert admin_client().get('/admin/profiling').get_json()['routes'] == {}
+
+
+if __name__ == "__main__":
+    test_sampler_folds_stacks_of_tracked_threads()
+    test_distinct_stacks_are_capped()
+    test_sampled_requests_are_aggregated_per_route()
+    print("SUCCESS: Profiling works!")
@@ -0,0 +1,142 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+
+from db_routing import RoutingSession, ReplicaRouter, use_replica
+
+# Two local SQLite files stand in for primary + replica.
+# "Replication" is simulated by copying the primary file over the replica.
+tmp_dir = tempfile.mkdtemp()
+primary_path = os.path.join(tmp_dir, 'primary.db')
+replica_path = os.path.join(tmp_dir, 'replica.db')
+
+app = Flask(__name__)
+app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{primary_path}'
+app.config['SQLALCHEMY_REPLICA_URIS'] = [f'sqlite:///{replica_path}']
+app.config['REPLICA_MAX_LAG'] = 5
+app.config['REPLICA_CHECK_INTERVAL'] = 0  # Re-check on every read in tests
+app.config['REPLICA_HEARTBEAT_INTERVAL'] = 0  # Tests stamp the heartbeat themselves
+db = SQLAlchemy(app, session_options={'class_': RoutingSession})
+
+
+class Note(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    text = db.Column(db.String(50))
+
+
+with app.app_context():
+    db.create_all()
+router = ReplicaRouter()
+router.init_app(app, db)
+
+
+def replicate():
+    router.replicas[0].dispose()
+    shutil.copy(primary_path, replica_path)
+
+
+def texts():
+    return sorted(n.text for n in Note.query.all())
+
+
+def test_reads_route_to_replica():
+    with app.app_context():
+        db.session.add(Note(text='synced'))
+        db.session.commit()
+        router.beat()
+        replicate()
+
+        # Only the primary sees this one
+        db.session.add(Note(text='primary-only'))
+        db.session.commit()
+        db.session.remove()
+
+        assert texts() == ['primary-only', 'synced']
+        db.session.remove()
+
+        with use_replica():
+            assert texts() == ['synced']
+        db.session.remove()
+
+
+def test_read_after_write_stays_on_primary():
+    with app.app_context():
+        router.beat()
+        replicate()
+        with use_replica():
+            db.session.add(Note(text='fresh'))
+            db.session.commit()
+            assert 'fresh' in texts()
+        db.session.remove()
+
+
+def test_lagging_replica_falls_back_to_primary():
+    with app.app_context():
+        router.beat(time.time() - 60)
+        replicate()
+        router.beat()  # Primary moves on, replica is now 60s behind
+
+        db.session.add(Note(text='after-lag'))
+        db.session.commit()
+        db.session.remove()
+
+        with use_replica():
+            assert 'after-lag' in texts()
+        assert router.status()[0] > router.max_lag
+        db.session.remove()
+
+
+def test_heartbeat_keeps_idle_in_sync_replica_healthy():
+    # A replica pointing at the primary's own file is always fully in sync
+    sync_app = Flask(__name__)
+    sync_app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{primary_path}'
+    sync_app.config['SQLALCHEMY_REPLICA_URIS'] = [f'sqlite:///{primary_path}']
+    sync_app.config['REPLICA_MAX_LAG'] = 1
+    sync_app.config['REPLICA_CHECK_INTERVAL'] = 0
+    sync_app.config['REPLICA_HEARTBEAT_INTERVAL'] = 0.2
+    sync_db = SQLAlchemy(sync_app, session_options={'class_': RoutingSession})
+    sync_router = ReplicaRouter()
+    sync_router.init_app(sync_app, sync_db)
+    assert sync_router._heartbeat_thread is None  # Only the worker process writes heartbeats
+    sync_router.start_heartbeat()
+
+    time.sleep(1.5)  # Longer than max lag with no reads at all
+    assert sync_router.is_healthy(0)
+    assert sync_router.status()[0] < 0.5
+
+
+def test_concurrent_first_checks_measure_lag_once():
+    checker = ReplicaRouter()
+    checker.replicas = [None]
+    checker.check_interval = 60
+    calls, release = [], threading.Event()
+
+    def slow_lag(index):
+        calls.append(index)
+        release.wait(2)
+        return 0.0
+    checker.lag = slow_lag
+
+    first = threading.Thread(target=checker.is_healthy, args=(0,))
+    first.start()
+    while not calls:
+        time.sleep(0.01)
+    # While the first check is in flight, others don't queue up their own round trips
+    assert [checker.is_healthy(0) for _ in range(5)] == [False] * 5
+    release.set()
+    first.join()
+    assert calls == [0] and checker.is_healthy(0)
+
+
+if __name__ == "__main__":
+    test_reads_route_to_replica()
+    test_read_after_write_stays_on_primary()
+    test_lagging_replica_falls_back_to_primary()
+    test_heartbeat_keeps_idle_in_sync_replica_healthy()
+    test_concurrent_first_checks_measure_lag_once()
+    print("SUCCESS: Replica routing works!")
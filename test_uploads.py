@@ -0,0 +1,92 @@
+import io
+import os
+import tempfile
+
+from PIL import Image
+
+import conftest  # noqa: F401  (isolated DB + test keys; must come before importing the app)
+
+from uploads import CloudinaryStorage, FakeCloudinaryUploader, ImagePipeline, LocalStorage, sniff_image_type
+
+tmp_dir = tempfile.mkdtemp()
+
+
+def make_png(width=1600, height=1200):
+    buf = io.BytesIO()
+    Image.new('RGB', (width, height), (200, 40, 40)).save(buf, 'PNG')
+    buf.seek(0)
+    return buf
+
+
+def run_pipeline(storage):
+    pipeline = ImagePipeline(storage, workers=2, tmp_dir=os.path.join(tmp_dir, 'spool'))
+    tmp_path, kind = pipeline.spool(make_png())
+    assert kind == 'png'
+
+    results = []
+    future = pipeline.submit(tmp_path, 'avatars/1/v1', lambda urls, error: results.append((urls, error)))
+    future.result(timeout=30)
+    pipeline.shutdown()
+
+    assert not os.path.exists(tmp_path)  # Temp original is always cleaned up
+    urls, error = results[0]
+    assert error is None
+    return urls
+
+
+def test_local_storage_writes_resized_webp():
+    storage = LocalStorage(os.path.join(tmp_dir, 'media'))
+    urls = run_pipeline(storage)
+    assert urls == {'thumb': '/media/avatars/1/v1/thumb.webp', 'medium': '/media/avatars/1/v1/medium.webp'}
+
+    with Image.open(storage.path('avatars/1/v1/thumb.webp')) as im:
+        assert im.format == 'WEBP' and im.size == (96, 96)
+
+
+def test_cloudinary_backend_with_fake_uploader():
+    fake = FakeCloudinaryUploader(os.path.join(tmp_dir, 'cloud'))
+    urls = run_pipeline(CloudinaryStorage(uploader=fake))
+    assert urls['medium'] == 'https://res.cloudinary.test/jeeto_jee/avatars/1/v1/medium.webp'
+    assert sorted(fake.uploads) == ['jeeto_jee/avatars/1/v1/medium', 'jeeto_jee/avatars/1/v1/thumb']
+
+
+def test_non_images_are_rejected_without_decoding():
+    pipeline = ImagePipeline(LocalStorage(os.path.join(tmp_dir, 'media')), tmp_dir=os.path.join(tmp_dir, 'spool'))
+    assert pipeline.spool(io.BytesIO(b'<?php echo "hi"; ?>')) == (None, None)
+    assert sniff_image_type(b'RIFF\x00\x00\x00\x00WEBPVP8 ') == 'webp'
+    pipeline.shutdown()
+
+
+def test_instance_folder_is_not_served():
+    import app as app_module
+    from app import app
+
+    secret = os.path.join(app.instance_path, 'upload_tmp', 'probe.png')
+    os.makedirs(os.path.dirname(secret), exist_ok=True)
+    with open(secret, 'wb') as f:
+        f.write(b'original')
+    client = app.test_client()
+    for url in ('/instance/upload_tmp/probe.png', '/./instance/upload_tmp/probe.png',
+                '/x/../instance/upload_tmp/probe.png'):
+        assert client.get(url).status_code == 404, url
+    assert client.get('/styles.css').status_code == 200
+
+    # Variants are only reachable through /media, with immutable caching
+    storage = LocalStorage(os.path.join(tmp_dir, 'served'))
+    storage.save('avatars/9/v1/thumb.webp', b'variant', 'image/webp')
+    original = app_module.image_pipeline.storage
+    app_module.image_pipeline.storage = storage
+    try:
+        response = client.get('/media/avatars/9/v1/thumb.webp')
+    finally:
+        app_module.image_pipeline.storage = original
+    assert response.status_code == 200
+    assert 'immutable' in response.headers['Cache-Control']
+
+
+if __name__ == "__main__":
+    test_local_storage_writes_resized_webp()
+    test_cloudinary_backend_with_fake_uploader()
+    test_non_images_are_rejected_without_decoding()
+    test_instance_folder_is_not_served()
+    print("SUCCESS: Upload pipeline works!")
@@ -0,0 +1,106 @@
+import hashlib
+import hmac
+import os
+import threading
+
+import conftest  # noqa: F401  (isolated DB + test keys; must come before importing the app)
+
+import app as app_module
+from app import app, db, Payment, PaymentVerification, recent_verifications
+
+
+def signed_payload(order_id, payment_id, custom_id):
+    message = f"{order_id}|{payment_id}".encode()
+    signature = hmac.new(os.environ['RAZORPAY_KEY_SECRET'].encode(), message, hashlib.sha256).hexdigest()
+    return {
+        'razorpay_order_id': order_id,
+        'razorpay_payment_id': payment_id,
+        'razorpay_signature': signature,
+        'custom_id': custom_id,
+        'student_details': {'name': 'Race Test', 'email': 'race@test.com', 'phone': '9000000000'},
+        'plan_details': {'name': 'Standard Plan', 'category': 'april', 'price': 499}
+    }
+
+
+def count_signature_checks():
+    calls = []
+    original = app_module.client.utility.verify_payment_signature
+
+    def counting(params):
+        calls.append(params)
+        return original(params)
+    app_module.client.utility.verify_payment_signature = counting
+    return calls, original
+
+
+def test_50_concurrent_identical_verifications():
+    with app.app_context():
+        db.session.add(Payment(custom_id='#RACE001', status='CREATED', razorpay_order_id='order_race_1'))
+        db.session.commit()
+
+    payload = signed_payload('order_race_1', 'pay_race_1', '#RACE001')
+    calls, original = count_signature_checks()
+    results = []
+    start = threading.Barrier(50)
+
+    def fire():
+        client = app.test_client()
+        start.wait()
+        response = client.post('/api/verify-payment', json=payload)
+        results.append((response.status_code, response.get_json()))
+
+    try:
+        threads = [threading.Thread(target=fire) for _ in range(50)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        app_module.client.utility.verify_payment_signature = original
+
+    assert len(results) == 50
+    assert all(r == (200, {'status': 'success', 'custom_id': '#RACE001'}) for r in results), results
+    assert len(calls) == 1  # Gateway utility touched exactly once
+
+    with app.app_context():
+        assert Payment.query.filter_by(custom_id='#RACE001').one().status == 'PAID'
+        assert PaymentVerification.query.filter_by(idempotency_key='order_race_1|pay_race_1').one().state == 'DONE'
+
+
+def test_duplicate_fail_safe_creates_single_row():
+    payload = signed_payload('order_lost_1', 'pay_lost_1', '#LOST001')
+    client = app.test_client()
+    first = client.post('/api/verify-payment', json=payload)
+
+    # Cold cache (e.g. another worker): answered from the stored outcome
+    recent_verifications.discard('order_lost_1|pay_lost_1')
+    second = client.post('/api/verify-payment', json=payload)
+
+    assert first.get_json() == second.get_json() == {'status': 'success', 'custom_id': '#LOST001'}
+    with app.app_context():
+        assert Payment.query.filter_by(custom_id='#LOST001').count() == 1
+
+
+def test_bad_signature_does_not_lock_out_real_submission():
+    with app.app_context():
+        db.session.add(Payment(custom_id='#BAD001', status='CREATED', razorpay_order_id='order_bad_1'))
+        db.session.commit()
+
+    genuine = signed_payload('order_bad_1', 'pay_bad_1', '#BAD001')
+    forged = dict(genuine, razorpay_signature='forged')
+    client = app.test_client()
+    assert client.post('/api/verify-payment', json=forged).status_code == 400
+    with app.app_context():
+        assert PaymentVerification.query.filter_by(idempotency_key='order_bad_1|pay_bad_1').count() == 0
+
+    response = client.post('/api/verify-payment', json=genuine)
+    assert response.status_code == 200 and response.get_json()['status'] == 'success'
+    with app.app_context():
+        assert Payment.query.filter_by(custom_id='#BAD001').one().status == 'PAID'
+
+
+if __name__ == "__main__":
+    test_50_concurrent_identical_verifications()
+    test_duplicate_fail_safe_creates_single_row()
+    test_bad_signature_does_not_lock_out_real_submission()
+    print("SUCCESS: verify-payment is idempotent!")
@@ -0,0 +1,189 @@
+"""
+Profile image uploads.
+
+The request thread only streams the uploaded file into a temp file and sniffs
+its magic bytes; it never decodes the image. Decoding, square-cropping,
+resizing and WebP conversion happen on a small background worker pool, and
+the rendered variants are handed to a pluggable storage backend:
+
+    LocalStorage        files on disk, served by the app at /media/<key>
+    CloudinaryStorage   Cloudinary CDN (pass FakeCloudinaryUploader for local dev/tests)
+"""
+import io
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Variant name -> square edge in px (avatar is shown at 140px, "medium" covers 2x screens)
+AVATAR_SIZES = {'thumb': 96, 'medium': 320}
+WEBP_QUALITY = 80
+CHUNK_SIZE = 64 * 1024
+
+_SIGNATURES = [
+    (b'\xff\xd8\xff', 'jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+]
+
+
+def sniff_image_type(head):
+    """Identify an image from its first bytes without decoding it."""
+    for signature, kind in _SIGNATURES:
+        if head.startswith(signature):
+            return kind
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+# ------------------------------------------------------------------------------
+# Storage Backends
+# ------------------------------------------------------------------------------
+class LocalStorage:
+    def __init__(self, root, url_prefix='/media'):
+        self.root = os.path.abspath(root)
+        self.url_prefix = url_prefix.rstrip('/')
+        os.makedirs(self.root, exist_ok=True)
+
+    def path(self, key):
+        full = os.path.abspath(os.path.join(self.root, key))
+        if not full.startswith(self.root + os.sep):
+            raise ValueError(f"Invalid storage key: {key}")
+        return full
+
+    def save(self, key, data, content_type):
+        # Write to a temp file then rename so readers never see a half-written image
+        full = self.path(key)
+        os.makedirs(os.path.dirname(full), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(full))
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, full)
+        return f"{self.url_prefix}/{key}"
+
+    def delete_prefix(self, prefix):
+        shutil.rmtree(self.path(prefix), ignore_errors=True)
+
+
+class CloudinaryStorage:
+    def __init__(self, uploader=None, folder='jeeto_jee'):
+        if uploader is None:
+            # Configured from CLOUDINARY_URL by the SDK itself
+            import cloudinary.uploader
+            uploader = cloudinary.uploader
+        self.uploader = uploader
+        self.folder = folder
+
+    def save(self, key, data, content_type):
+        public_id = f"{self.folder}/{os.path.splitext(key)[0]}"
+        result = self.uploader.upload(io.BytesIO(data), public_id=public_id, overwrite=True,
+                                      resource_type='image', format='webp')
+        return result['secure_url']
+
+    def delete_prefix(self, prefix):
+        # Old versions are left for Cloudinary's own retention rules
+        pass
+
+
+class FakeCloudinaryUploader:
+    """Stand-in for ``cloudinary.uploader`` that keeps uploads in a local dir."""
+
+    def __init__(self, root):
+        self.root = root
+        self.uploads = []
+
+    def upload(self, file, public_id, **options):
+        path = os.path.join(self.root, f"{public_id}.{options.get('format', 'bin')}")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(file.read())
+        self.uploads.append(public_id)
+        return {'public_id': public_id, 'secure_url': f"https://res.cloudinary.test/{public_id}.{options.get('format', 'bin')}"}
+
+
+def make_storage(kind, media_root):
+    if kind == 'cloudinary':
+        return CloudinaryStorage()
+    if kind == 'cloudinary-fake':
+        return CloudinaryStorage(uploader=FakeCloudinaryUploader(media_root))
+    return LocalStorage(media_root)
+
+
+# ------------------------------------------------------------------------------
+# Background Processing
+# ------------------------------------------------------------------------------
+def render_variants(src_path, sizes=AVATAR_SIZES, quality=WEBP_QUALITY):
+    """Decode once and return {variant name: WebP bytes}. Runs on a worker thread."""
+    from PIL import Image, ImageOps
+
+    largest = max(sizes.values())
+    with Image.open(src_path) as im:
+        # Let JPEG decode at a reduced scale when the original is much larger than we need
+        im.draft('RGB', (largest, largest))
+        im = ImageOps.exif_transpose(im)
+        im = im.convert('RGBA' if 'A' in im.getbands() else 'RGB')
+        variants = {}
+        for name, edge in sizes.items():
+            resized = ImageOps.fit(im, (edge, edge), Image.LANCZOS)
+            buf = io.BytesIO()
+            resized.save(buf, 'WEBP', quality=quality, method=4)
+            variants[name] = buf.getvalue()
+    return variants
+
+
+class ImagePipeline:
+    def __init__(self, storage, workers=2, tmp_dir=None, sizes=AVATAR_SIZES):
+        self.storage = storage
+        self.sizes = sizes
+        self.tmp_dir = tmp_dir or tempfile.gettempdir()
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='image-worker')
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self):
+        return self._pending
+
+    def spool(self, stream):
+        """Stream an upload into a temp file. Returns (path, sniffed type) or (None, None)."""
+        head = stream.read(16)
+        kind = sniff_image_type(head)
+        if not kind:
+            return None, None
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir, suffix=f'.{kind}')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(head)
+            shutil.copyfileobj(stream, f, CHUNK_SIZE)
+        return tmp_path, kind
+
+    def submit(self, tmp_path, key_prefix, on_done):
+        """Queue resizing; ``on_done(urls, error)`` is called from the worker."""
+        with self._lock:
+            self._pending += 1
+        return self._executor.submit(self._process, tmp_path, key_prefix, on_done)
+
+    def _process(self, tmp_path, key_prefix, on_done):
+        urls, error = None, None
+        try:
+            variants = render_variants(tmp_path, self.sizes)
+            urls = {name: self.storage.save(f"{key_prefix}/{name}.webp", data, 'image/webp')
+                    for name, data in variants.items()}
+        except Exception as e:
+            print(f"Image processing failed for {key_prefix}: {e}")
+            error = e
+        finally:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            with self._lock:
+                self._pending -= 1
+        on_done(urls, error)
+        return urls
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,19 @@
+import sys
+
+from app import app, job_queue, replica_router
+import tasks  # Registers job handlers
+
+# Usage:
+#   python worker.py            run forever (Procfile "worker" process)
+#   python worker.py --drain    run every due job once, then exit
+#   python worker.py --requeue  give DEAD jobs a fresh set of attempts
+if __name__ == '__main__':
+    with app.app_context():
+        if '--drain' in sys.argv:
+            print(f"Ran {job_queue.drain()} jobs")
+        elif '--requeue' in sys.argv:
+            print(f"Requeued {job_queue.requeue_dead()} dead jobs")
+        else:
+            # The one process that stamps the replica-lag heartbeat (no-op without replicas)
+            replica_router.start_heartbeat()
+            job_queue.run_forever()